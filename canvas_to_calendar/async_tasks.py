@@ -0,0 +1,126 @@
+"""
+Async Google Tasks export: runs the blocking googleapiclient requests on a
+thread pool with a cap on requests in flight and a token-bucket rate limit.
+"""
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable
+
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.errors import HttpError
+
+from canvas_client import Assignment
+from google_tasks import get_tasks_service, prepare_sync, summarize_sync, sync_requests
+from tasks_batch import is_retryable
+
+# Stay under the Tasks API per-user quota (queries per minute per user)
+DEFAULT_RATE = 10.0  # requests per second
+DEFAULT_BURST = 20
+DEFAULT_MAX_IN_FLIGHT = 8
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0  # seconds
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average, with bursts of up to `capacity`."""
+
+    def __init__(self, rate: float = DEFAULT_RATE, capacity: float = DEFAULT_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+_thread_local = threading.local()
+
+
+def _thread_http(service):
+    """
+    httplib2 connections aren't thread-safe, so give each worker thread its own,
+    authorized with the same credentials as the service.
+    """
+    shared = getattr(service, "_http", None)
+    if shared is None:
+        return None  # stubbed services execute without an Http object
+
+    by_service = getattr(_thread_local, "http_by_service", None)
+    if by_service is None:
+        by_service = _thread_local.http_by_service = {}
+
+    http = by_service.get(id(service))
+    if http is None:
+        if isinstance(shared, AuthorizedHttp):
+            http = AuthorizedHttp(shared.credentials, http=httplib2.Http())
+        else:
+            http = httplib2.Http()
+        by_service[id(service)] = http
+    return http
+
+
+async def _execute(loop, pool, service, request, semaphore: asyncio.Semaphore, bucket: TokenBucket):
+    """Execute one request, retrying 429/5xx with full-jitter exponential backoff."""
+    for attempt in range(MAX_RETRIES + 1):
+        await bucket.acquire()
+        async with semaphore:
+            try:
+                return await loop.run_in_executor(
+                    pool, lambda: request.execute(http=_thread_http(service))
+                )
+            except HttpError as e:
+                if not is_retryable(e) or attempt == MAX_RETRIES:
+                    raise
+                status = e.resp.status
+        delay = random.uniform(0, BACKOFF_BASE * 2 ** attempt)
+        logging.info(f"Task request throttled ({status}), retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+
+async def export_assignments_to_tasks_async(assignments: Iterable[Assignment], service=None,
+                                            max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+                                            rate: float = DEFAULT_RATE, burst: float = DEFAULT_BURST,
+                                            tasklist_id: str = "@default"):
+    """
+    Async counterpart of google_tasks.export_assignments_to_tasks, with the same summary.
+    Individual requests run concurrently instead of being grouped into batches.
+    """
+    service = service or get_tasks_service()
+    loop = asyncio.get_running_loop()
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        plan = await loop.run_in_executor(pool, prepare_sync, service, list(assignments), tasklist_id)
+        requests = sync_requests(service, plan, tasklist_id)
+
+        semaphore = asyncio.Semaphore(max_in_flight)
+        bucket = TokenBucket(rate, burst)
+        outcomes = await asyncio.gather(
+            *(_execute(loop, pool, service, request, semaphore, bucket) for _, request in requests),
+            return_exceptions=True,
+        )
+
+    responses = {}
+    errors = {}
+    for (request_id, _), outcome in zip(requests, outcomes):
+        if isinstance(outcome, Exception):
+            errors[request_id] = outcome
+        else:
+            responses[request_id] = outcome
+
+    return summarize_sync(plan, responses, errors)
@@ -0,0 +1,316 @@
+"""
+Benchmarks for the Canvas sync, run against local stand-in servers.
+
+    python benchmark.py                  # everything
+    python benchmark.py sync --json out  # end-to-end suite only, results saved as JSON
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+from canvas_client import (Assignment, AssignmentQuery, CanvasClient, MOUNTAIN_TZ, due_sort_key,
+                           parse_canvas_dates)
+from async_tasks import export_assignments_to_tasks_async
+from fake_canvas import FakeCanvas
+from fake_tasks import FakeTasksServer, FakeTasksService, build_service
+from google_tasks import export_assignments_to_tasks, plan_tasks, prepare_sync, summarize_sync, sync_requests
+
+
+def bench_fan_out(courses: int, latency: float, workers: int):
+    """Compare serial and concurrent get_all_assignments against the fake Canvas server."""
+    print(f"get_all_assignments: {courses} courses, {latency * 1000:.0f} ms latency")
+    with FakeCanvas(courses=courses, latency=latency) as canvas:
+        baseline = None
+        for max_workers in (1, workers):
+            canvas.request_count = 0
+            client = CanvasClient(canvas.base_url, "fake-token", max_workers=max_workers)
+            start = time.perf_counter()
+            assignments = client.get_all_assignments()
+            elapsed = time.perf_counter() - start
+
+            if baseline is None:
+                baseline = (elapsed, assignments)
+            elif assignments != baseline[1]:
+                raise AssertionError("concurrent fetch returned different assignments")
+
+            speedup = baseline[0] / elapsed
+            print(f"  workers={max_workers:<3} {elapsed:7.3f}s  {canvas.request_count:4} requests"
+                  f"  {len(assignments)} assignments  {speedup:.1f}x")
+
+
+def bench_cache(courses: int, latency: float, workers: int):
+    """Compare a cold sync with a warm one that revalidates every page with ETags."""
+    print(f"conditional requests: {courses} courses, {latency * 1000:.0f} ms latency")
+    with FakeCanvas(courses=courses, latency=latency) as canvas, \
+            tempfile.TemporaryDirectory() as tmp:
+        client = CanvasClient(canvas.base_url, "fake-token", max_workers=workers,
+                              cache_path=os.path.join(tmp, "cache.sqlite3"))
+        for label in ("cold", "warm"):
+            canvas.request_count = canvas.bytes_sent = 0
+            start = time.perf_counter()
+            changes = client.get_changed_assignments()
+            elapsed = time.perf_counter() - start
+            print(f"  {label}  {elapsed:7.3f}s  {canvas.request_count:4} requests"
+                  f"  {canvas.bytes_sent / 1024:8.1f} KiB  {len(changes.changed)} changed")
+
+
+def bench_query(courses: int, latency: float, workers: int):
+    """Compare payloads of the old unfiltered assignment requests with the default query."""
+    print(f"assignment query: {courses} courses, a quarter of them concluded")
+    legacy = AssignmentQuery(include_all_dates=True, fields=None, skip_concluded_courses=False)
+    queries = [("legacy", legacy), ("default", AssignmentQuery()),
+               ("future", AssignmentQuery(bucket="future"))]
+    with FakeCanvas(courses=courses, latency=latency, concluded_courses=courses // 4) as canvas:
+        client = CanvasClient(canvas.base_url, "fake-token", max_workers=workers)
+        for label, query in queries:
+            canvas.request_count = canvas.bytes_sent = 0
+            assignments = client.get_all_assignments(query)
+            print(f"  {label:8} {canvas.request_count:4} requests  {canvas.bytes_sent / 1024:8.1f} KiB"
+                  f"  {len(assignments)} assignments")
+
+
+def synthetic_assignments(count: int) -> list:
+    """Assignments spread over 40 courses, every tenth one undated."""
+    start = datetime.now(MOUNTAIN_TZ).replace(hour=23, minute=59, second=0, microsecond=0)
+    return [
+        Assignment(
+            name=f"Assignment {i}",
+            course_name=f"CS {100 + i % 40} - Section 001",
+            due_at=None if i % 10 == 9 else start + timedelta(hours=7 * i),
+            id=i,
+            course_id=i % 40,
+        )
+        for i in range(count)
+    ]
+
+
+def bench_plan(count: int):
+    """Time the pure task planning stage of the Google Tasks export."""
+    assignments = synthetic_assignments(count)
+    start = time.perf_counter()
+    plan = plan_tasks(assignments)
+    elapsed = time.perf_counter() - start
+    print(f"plan_tasks: {count} assignments -> {len(plan.tasks)} tasks in {elapsed * 1000:.1f} ms")
+
+
+def bench_memory(count: int):
+    """Report memory held per Assignment record, strings and datetimes included."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    assignments = synthetic_assignments(count)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(f"memory: {count} assignments, {used / count:.0f} bytes per record")
+    return assignments
+
+
+def bench_dates(count: int):
+    """Compare per-item dateutil parsing with the batch ISO-8601 path on raw due_at strings."""
+    from dateutil.parser import parse
+    from zoneinfo import ZoneInfo
+
+    start = datetime(2026, 1, 5, 6, 59)
+    values = [
+        None if i % 10 == 9 else (start + timedelta(hours=i % 5000)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        for i in range(count)
+    ]
+
+    def per_item():
+        dates = []
+        for value in values:
+            due_at = parse(value) if value else None
+            if due_at is not None and due_at.tzinfo is None:
+                due_at = due_at.replace(tzinfo=ZoneInfo("UTC"))
+            dates.append(due_at.astimezone(MOUNTAIN_TZ) if due_at else None)
+        assignments = [Assignment("", "", d) for d in dates]
+        assignments.sort(key=lambda x: x.due_at or datetime.max.replace(tzinfo=MOUNTAIN_TZ))
+        return [a.due_at for a in assignments]
+
+    def batched():
+        assignments = [Assignment("", "", d) for d in parse_canvas_dates(values)]
+        assignments.sort(key=due_sort_key)
+        return [a.due_at for a in assignments]
+
+    print(f"date normalization: {count} records")
+    expected = None
+    for label, normalize in (("dateutil", per_item), ("batch", batched)):
+        begin = time.perf_counter()
+        result = normalize()
+        elapsed = time.perf_counter() - begin
+        if expected is None:
+            expected = result
+        elif result != expected:
+            raise AssertionError("batch date normalization disagrees with dateutil")
+        print(f"  {label:8} {elapsed * 1000:8.1f} ms")
+
+
+def _export_serially(assignments, service):
+    """The pre-batching export: one blocking round trip per request."""
+    plan = prepare_sync(service, assignments)
+    responses = {request_id: request.execute() for request_id, request in sync_requests(service, plan)}
+    return summarize_sync(plan, responses, {})
+
+
+def bench_export(count: int, latency: float, workers: int):
+    """Compare serial, batched and async exports of a first sync against the fake Tasks service."""
+    print(f"export: {count} assignments, {latency * 1000:.0f} ms latency")
+    assignments = synthetic_assignments(count)
+    exporters = [
+        ("serial", lambda service: _export_serially(assignments, service)),
+        ("batched", lambda service: export_assignments_to_tasks(assignments, service=service)),
+        # Rate limit lifted so the benchmark measures concurrency, not the quota
+        ("async", lambda service: asyncio.run(export_assignments_to_tasks_async(
+            assignments, service=service, max_in_flight=workers, rate=1000, burst=1000))),
+    ]
+    for label, export in exporters:
+        service = FakeTasksService(latency=latency)
+        start = time.perf_counter()
+        summary = export(service)
+        elapsed = time.perf_counter() - start
+        created = len(summary["created"]) + len(summary["no_due_tasks_created"])
+        print(f"  {label:8} {elapsed:7.3f}s  {service.round_trips:4} round trips  {created} tasks created")
+
+
+def bench_startup(module: str = "main", runs: int = 5):
+    """Measure the import cost of an entry point with python -X importtime."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    totals = []
+    slowest = {}
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=here, capture_output=True, text=True, check=True,
+        )
+        total = 0
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            _, cumulative, name = line.split("|")
+            # Nesting is shown as two spaces per level; nested time is already in the parent
+            depth = (len(name) - len(name.lstrip()) - 1) // 2
+            if depth == 0:
+                total += int(cumulative)
+            elif depth == 1:
+                slowest[name.strip()] = min(int(cumulative), slowest.get(name.strip(), sys.maxsize))
+        totals.append(total / 1000)
+
+    print(f"startup: import {module} best of {runs}: {min(totals):.1f} ms")
+    for name, micros in sorted(slowest.items(), key=lambda item: -item[1])[:5]:
+        print(f"  {micros / 1000:7.1f} ms  {name}")
+
+
+# (courses, assignments per course) for the end-to-end suite
+ACCOUNT_SIZES = [(4, 40), (12, 150), (30, 300)]
+
+
+def _client_sync(canvas_url: str, tasks_url: str, workers: int) -> dict:
+    """
+    The client side of bench_sync, run in its own process so tracemalloc's peak
+    counts only the client, not the stand-in servers and their stores.
+    """
+    from scheduler import WRITE_KEYS
+
+    logging.getLogger().setLevel(logging.WARNING)  # a spawned process starts with default logging
+    service = build_service(tasks_url)
+    client = CanvasClient(canvas_url, "fake-token", max_workers=workers)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    assignments = client.get_all_assignments()
+    fetched = time.perf_counter()
+    export_assignments_to_tasks(assignments, service=service)
+    exported = time.perf_counter()
+    summary = export_assignments_to_tasks(assignments, service=service)
+    steady = time.perf_counter()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "fetch_s": fetched - start,
+        "export_s": exported - fetched,
+        "steady_export_s": steady - exported,
+        "steady_task_writes": sum(len(summary[key]) for key in WRITE_KEYS),
+        "peak_bytes": peak,
+    }
+
+
+def bench_sync(latency: float, workers: int, sizes=ACCOUNT_SIZES) -> list:
+    """
+    End-to-end sync against both stand-in servers: fetch from Canvas, then export
+    to Google Tasks twice (first sync, then a steady-state sync that should not write).
+    """
+    print(f"end-to-end sync: {latency * 1000:.0f} ms latency, {workers} workers")
+    print(f"  {'account':>12} {'fetch':>8} {'export':>8} {'steady':>8} {'canvas req':>11}"
+          f" {'tasks req':>10} {'writes':>7} {'peak MiB':>9}")
+    results = []
+    for courses, per_course in sizes:
+        with FakeCanvas(courses=courses, assignments_per_course=per_course, latency=latency) as canvas, \
+                FakeTasksServer(latency=latency) as tasks:
+            # A fresh process per size, so one run's allocations don't affect the next
+            with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                client = pool.submit(_client_sync, canvas.base_url, tasks.base_url, workers).result()
+
+            writes = tasks.writes - client["steady_task_writes"]
+            peak = client["peak_bytes"]
+            result = {
+                "courses": courses,
+                "assignments": courses * per_course,
+                **client,
+                "canvas_requests": canvas.request_count,
+                "tasks_requests": tasks.round_trips,
+                "task_writes": writes,
+            }
+            results.append(result)
+            print(f"  {f'{courses}x{per_course}':>12} {result['fetch_s']:7.3f}s {result['export_s']:7.3f}s"
+                  f" {result['steady_export_s']:7.3f}s {result['canvas_requests']:11}"
+                  f" {result['tasks_requests']:10} {writes:7} {peak / 2 ** 20:9.1f}")
+            if result["steady_task_writes"]:
+                print(f"  warning: steady-state sync wrote {result['steady_task_writes']} tasks")
+    return results
+
+
+BENCHMARKS = ["startup", "fan-out", "cache", "query", "plan", "dates", "memory", "export", "sync"]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('benchmarks', nargs='*', choices=BENCHMARKS, default=BENCHMARKS)
+    parser.add_argument('--courses', type=int, default=12)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--plan-size', type=int, default=10_000)
+    parser.add_argument('--json', help='write end-to-end sync results to this file')
+
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)  # google_tasks logs every task at INFO
+    selected = set(args.benchmarks)
+    if "startup" in selected:
+        bench_startup()
+    if "fan-out" in selected:
+        bench_fan_out(args.courses, args.latency, args.workers)
+    if "cache" in selected:
+        bench_cache(args.courses, args.latency, args.workers)
+    if "query" in selected:
+        bench_query(args.courses, args.latency, args.workers)
+    if "plan" in selected:
+        bench_plan(args.plan_size)
+    if "dates" in selected:
+        bench_dates(100_000)
+    if "memory" in selected:
+        bench_memory(100_000)
+    if "export" in selected:
+        bench_export(60, args.latency, args.workers)
+    if "sync" in selected:
+        sync_results = bench_sync(args.latency, args.workers)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(sync_results, f, indent=2)
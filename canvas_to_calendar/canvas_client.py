@@ -1,106 +1,368 @@
+import json
+import threading
+import time
 import requests
-from dataclasses import dataclass
-from datetime import datetime, timedelta
-from typing import Optional, List
-from dateutil.parser import parse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterator, Optional, List, Tuple
 from zoneinfo import ZoneInfo
 
-from settings import CANVAS_BASE_URL, CANVAS_API_TOKEN
+from response_cache import CachedResponse, ResponseCache
 
 MOUNTAIN_TZ = ZoneInfo("America/Denver")
+UTC = timezone.utc
+# Sort key standing in for a missing due date, so undated assignments sort last
+UNDATED_SORT_KEY = datetime.max.replace(tzinfo=MOUNTAIN_TZ)
+# Assignments due longer ago than this (and courses with nothing due since) aren't fetched
+RECENT_WINDOW = timedelta(weeks=2)
 
-@dataclass
+# Canvas meters each token with a leaky bucket (700 units when full) and reports
+# what is left in X-Rate-Limit-Remaining. Slow down well before it runs dry.
+RATE_LIMIT_THRESHOLD = 100.0
+RATE_LIMIT_BACKOFF = 1.0  # seconds
+RATE_LIMIT_RETRIES = 5
+
+def _parse_canvas_date(value: str) -> datetime:
+    """Parse one Canvas timestamp to Mountain Time, via the fast ISO-8601 path when possible."""
+    try:
+        # Canvas sends 'YYYY-MM-DDTHH:MM:SSZ', which fromisoformat handles since Python 3.11
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        from dateutil.parser import parse
+        dt = parse(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=UTC)
+    return dt.astimezone(MOUNTAIN_TZ)
+
+
+def parse_canvas_dates(values: List[Optional[str]]) -> List[Optional[datetime]]:
+    """
+    Normalize a page of Canvas timestamps to Mountain Time in one pass.
+    Many assignments share a deadline, so each distinct timestamp is converted once.
+    """
+    converted = {}
+    results = []
+    for value in values:
+        if not value:
+            results.append(None)
+            continue
+        dt = converted.get(value)
+        if dt is None:
+            dt = converted[value] = _parse_canvas_date(value)
+        results.append(dt)
+    return results
+
+
+def due_sort_key(assignment: 'Assignment') -> datetime:
+    return assignment.due_at or UNDATED_SORT_KEY
+
+@dataclass(slots=True)
 class Assignment:
+    """One Canvas assignment. Slotted to keep large syncs compact in memory."""
     name: str
     course_name: str
     due_at: Optional[datetime]
+    id: Optional[int] = None
+    course_id: Optional[int] = None
+    updated_at: Optional[str] = None
+
+@dataclass
+class AssignmentQuery:
+    """
+    Server-side filters for the assignments endpoint, plus the fields callers need.
+    Canvas has no field selection, so `fields` is applied client-side: it keeps
+    records and cached pages small, not the response itself.
+    """
+    bucket: Optional[str] = None  # past, overdue, undated, ungraded, unsubmitted, upcoming or future
+    include_all_dates: bool = False  # per-section due dates; due_at is already the student's own
+    order_by: str = "due_at"
+    fields: Optional[Tuple[str, ...]] = ("id", "name", "due_at", "updated_at")  # None keeps everything
+    per_page: int = 100
+    skip_concluded_courses: bool = True  # don't request courses that ended before the cutoff
+
+    def params(self) -> dict:
+        params = {"per_page": self.per_page, "order_by": self.order_by}
+        if self.bucket:
+            params["bucket"] = self.bucket
+        if self.include_all_dates:
+            params["include[]"] = ["all_dates"]
+        return params
+
+    def project(self, item: dict) -> dict:
+        if self.fields is None:
+            return item
+        return {key: item.get(key) for key in self.fields}
+
+    def cache_tag(self) -> str:
+        """Appended to cache keys, so pages projected to different fields are cached apart."""
+        return "" if self.fields is None else "#fields=" + ",".join(self.fields)
+
+@dataclass
+class AssignmentChanges:
+    """Assignments that are new or updated since the last sync, and ids that disappeared."""
+    assignments: List[Assignment] = field(default_factory=list)
+    changed: List[Assignment] = field(default_factory=list)
+    removed_ids: List[int] = field(default_factory=list)
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.changed or self.removed_ids)
 
 class CanvasClient:
-    def __init__(self):
+    def __init__(self, base_url: Optional[str] = None, api_token: Optional[str] = None,
+                 max_workers: int = 8, cache_path: Optional[str] = None,
+                 adapter: Optional[requests.adapters.HTTPAdapter] = None,
+                 request_slots: Optional[threading.Semaphore] = None):
+        if base_url is None or api_token is None:
+            import settings
+            base_url = base_url or settings.CANVAS_BASE_URL
+            api_token = api_token or settings.CANVAS_API_TOKEN
+
+        self.base_url = base_url.rstrip("/")
+        self.max_workers = max(1, max_workers)
         self.session = requests.Session()
         self.session.headers.update({
-            "Authorization": f"Bearer {CANVAS_API_TOKEN}"
+            "Authorization": f"Bearer {api_token}"
         })
+        # One pooled connection per worker so concurrent fetches don't queue on the pool.
+        # Clients for several accounts can pass one adapter to share connections per host.
+        adapter = adapter or requests.adapters.HTTPAdapter(pool_maxsize=self.max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # Optional cap on requests in flight, shared by every client hitting the same host
+        self._request_slots = request_slots
 
-    def get_courses(self) -> list:
-        """Fetch all active courses with pagination."""
-        url = f"{CANVAS_BASE_URL}/api/v1/courses"
-        params = {"enrollment_state": "active", "per_page": 100}
-        all_courses = []
+        self._rate_limit_lock = threading.Lock()
+        self._rate_limit_remaining: Optional[float] = None
+
+        # Persistent ETag/Last-Modified cache; None disables conditional requests
+        self.cache = ResponseCache(cache_path) if cache_path else None
+
+    def _wait_for_rate_limit(self):
+        """Pause while Canvas reports the rate limit bucket is nearly empty."""
+        with self._rate_limit_lock:
+            remaining = self._rate_limit_remaining
+        if remaining is not None and remaining < RATE_LIMIT_THRESHOLD:
+            time.sleep(RATE_LIMIT_BACKOFF)
+
+    def _record_rate_limit(self, response: requests.Response):
+        remaining = response.headers.get("X-Rate-Limit-Remaining")
+        if remaining is None:
+            return
+        with self._rate_limit_lock:
+            self._rate_limit_remaining = float(remaining)
+
+    def _get(self, url: str, params: Optional[dict] = None,
+             headers: Optional[dict] = None) -> requests.Response:
+        """GET a Canvas URL, throttling on X-Rate-Limit-Remaining and retrying throttled requests."""
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            self._wait_for_rate_limit()
+            if self._request_slots is None:
+                r = self.session.get(url, params=params, headers=headers)
+            else:
+                with self._request_slots:
+                    r = self.session.get(url, params=params, headers=headers)
+            self._record_rate_limit(r)
+            # Canvas signals throttling with a 403 rather than a 429
+            throttled = r.status_code == 403 and "Rate Limit Exceeded" in r.text
+            if not throttled or attempt == RATE_LIMIT_RETRIES:
+                break
+            time.sleep(RATE_LIMIT_BACKOFF * 2 ** attempt)
+        r.raise_for_status()
+        return r
+
+    def _get_page(self, url: str, params: Optional[dict] = None,
+                  project: Optional[Callable[[dict], dict]] = None, cache_tag: str = "") -> tuple:
+        """
+        Fetch one page, revalidating against the cache. Returns (items, next_url).
+        Items are passed through `project`, and the cache stores the projected page
+        under the URL plus `cache_tag`, which must identify the projection.
+        """
+        if self.cache is None:
+            r = self._get(url, params=params)
+            items = r.json()
+            if project:
+                items = [project(item) for item in items]
+            return items, r.links.get('next', {}).get('url')
 
+        # Key the cache on the full URL, query string included, and the projection
+        full_url = requests.Request("GET", url, params=params).prepare().url
+        cached = self.cache.get(full_url + cache_tag)
+        headers = cached.conditional_headers() if cached else None
+
+        r = self._get(full_url, headers=headers)
+        if r.status_code == 304 and cached:
+            return json.loads(cached.body), cached.next_url
+
+        items = r.json()
+        if project:
+            items = [project(item) for item in items]
+        next_url = r.links.get('next', {}).get('url')
+        etag = r.headers.get("ETag")
+        last_modified = r.headers.get("Last-Modified")
+        if etag or last_modified:
+            body = json.dumps(items) if project else r.text
+            self.cache.put(full_url + cache_tag, CachedResponse(etag, last_modified, next_url, body))
+        return items, next_url
+
+    def _iter_pages(self, url: str, params: Optional[dict] = None,
+                    project: Optional[Callable[[dict], dict]] = None, cache_tag: str = "") -> Iterator[list]:
+        """Follow Link: next headers, yielding each page as it arrives."""
         while url:
-            r = self.session.get(url, params=params)
-            r.raise_for_status()
-            all_courses.extend(r.json())
-            url = r.links.get('next', {}).get('url')
+            page, url = self._get_page(url, params, project, cache_tag)
+            yield page
             params = None  # only needed for first request
-        return all_courses
 
-    def get_assignments_for_course(self, course_id: int) -> list:
+    def _iter_paginated(self, url: str, params: Optional[dict] = None,
+                        project: Optional[Callable[[dict], dict]] = None) -> Iterator[dict]:
+        """Follow Link: next headers, yielding items as each page arrives."""
+        for page in self._iter_pages(url, params, project):
+            yield from page
+
+    def iter_courses(self) -> Iterator[dict]:
+        """Stream all active courses, page by page."""
+        url = f"{self.base_url}/api/v1/courses"
+        params = {"enrollment_state": "active", "per_page": 100}
+        return self._iter_paginated(url, params)
+
+    def iter_assignments_for_course(self, course_id: int,
+                                    query: Optional[AssignmentQuery] = None) -> Iterator[dict]:
+        """Stream all assignments (including external/LTI) for a course, page by page."""
+        for page in self._iter_assignment_pages(course_id, query):
+            yield from page
+
+    def _iter_assignment_pages(self, course_id: int,
+                               query: Optional[AssignmentQuery] = None) -> Iterator[list]:
+        query = query or AssignmentQuery()
+        url = f"{self.base_url}/api/v1/courses/{course_id}/assignments"
+        return self._iter_pages(url, query.params(), query.project, query.cache_tag())
+
+    def get_courses(self) -> list:
+        """Fetch all active courses with pagination."""
+        return list(self.iter_courses())
+
+    def get_assignments_for_course(self, course_id: int,
+                                   query: Optional[AssignmentQuery] = None) -> list:
         """Fetch all assignments (including external/LTI) for a course with pagination."""
-        url = f"{CANVAS_BASE_URL}/api/v1/courses/{course_id}/assignments"
-        params = {
-            "per_page": 100,
-            "include[]": ["submission_types", "all_dates"]
-        }
-        all_assignments = []
+        return list(self.iter_assignments_for_course(course_id, query))
 
-        while url:
-            r = self.session.get(url, params=params)
-            r.raise_for_status()
-            all_assignments.extend(r.json())
-            url = r.links.get('next', {}).get('url')
-            params = None  # only needed for first request
-        return all_assignments
+    @staticmethod
+    def course_may_be_recent(course: dict, cutoff: datetime) -> bool:
+        """False for courses that ended before the cutoff, which can't have recent due dates."""
+        end_at = course.get("end_at")
+        if not end_at:
+            return True
+        return _parse_canvas_date(end_at) >= cutoff
 
     def canvas_to_mountain(self, due_utc: Optional[datetime]) -> Optional[datetime]:
         """Convert Canvas UTC datetime to Mountain Time (DST-aware)."""
         if due_utc is None:
             return None
         if due_utc.tzinfo is None:
-            due_utc = due_utc.replace(tzinfo=ZoneInfo("UTC"))
+            due_utc = due_utc.replace(tzinfo=UTC)
         return due_utc.astimezone(MOUNTAIN_TZ)
 
-    from datetime import timedelta
-
-    def get_all_assignments(self) -> List[Assignment]:
-        """Fetch all assignments for courses with at least one recent due date."""
-        results: List[Assignment] = []
-        cutoff = datetime.now(MOUNTAIN_TZ) - timedelta(weeks=2)  # 2 weeks ago
-
-        for course in self.get_courses():
-            course_name = course.get("name", "Unknown Course")
-            course_assignments: List[Assignment] = []
+    def _recent_course_assignments(self, course: dict, cutoff: datetime,
+                                   query: AssignmentQuery) -> List[Assignment]:
+        """
+        Stream one course's assignments and keep those due after the cutoff or undated.
+        Returns nothing if the course has no dated assignment after the cutoff.
+        """
+        course_name = course.get("name", "Unknown Course")
+        kept: List[Assignment] = []
+        has_recent_due = False
 
-            # Collect assignments with local due dates
-            for a in self.get_assignments_for_course(course["id"]):
-                due_at = parse(a["due_at"]) if a.get("due_at") else None
-                due_at_local = self.canvas_to_mountain(due_at)
+        for page in self._iter_assignment_pages(course["id"], query):
+            due_dates = parse_canvas_dates([a.get("due_at") for a in page])
+            for a, due_at_local in zip(page, due_dates):
+                # Include assignments:
+                # - dated assignments within the last 2 weeks
+                # - undated assignments
+                if due_at_local is not None:
+                    if due_at_local < cutoff:
+                        continue
+                    has_recent_due = True
 
-                course_assignments.append(
+                kept.append(
                     Assignment(
                         name=a["name"],
                         course_name=course_name,
-                        due_at=due_at_local
+                        due_at=due_at_local,
+                        id=a.get("id"),
+                        course_id=course["id"],
+                        updated_at=a.get("updated_at")
                     )
                 )
 
-            # Check if course has at least one assignment within the last 2 weeks
-            has_recent_due = any(
-                a.due_at is not None and a.due_at >= cutoff for a in course_assignments
-            )
+        # Skip entire course if no recent assignments
+        return kept if has_recent_due else []
+
+    def iter_all_assignments(self, query: Optional[AssignmentQuery] = None) -> Iterator[Assignment]:
+        """
+        Stream assignments for courses with at least one recent due date, course by course.
+        At most max_workers courses are fetched or held at once, and the next course is only
+        started as an earlier one is yielded, so a slow consumer holds at most max_workers
+        courses' filtered assignments. Courses are yielded in Canvas order so the output is
+        deterministic.
+        """
+        query = query or AssignmentQuery()
+        cutoff = datetime.now(MOUNTAIN_TZ) - RECENT_WINDOW
+        courses = (
+            c for c in self.iter_courses()
+            if not query.skip_concluded_courses or self.course_may_be_recent(c, cutoff)
+        )
+
+        if self.max_workers == 1:
+            for course in courses:
+                yield from self._recent_course_assignments(course, cutoff, query)
+            return
 
-            # Skip entire course if no recent assignments
-            if not has_recent_due:
-                continue
+        pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        pending = deque()
+        try:
+            for course in courses:
+                pending.append(pool.submit(self._recent_course_assignments, course, cutoff, query))
+                if len(pending) >= self.max_workers:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+        finally:
+            # Don't keep fetching if the caller stops iterating early
+            pool.shutdown(cancel_futures=True)
 
-            # Include assignments:
-            # - dated assignments within the last 2 weeks
-            # - undated assignments
-            for a in course_assignments:
-                if a.due_at is None or a.due_at >= cutoff:
-                    results.append(a)
+    def get_all_assignments(self, query: Optional[AssignmentQuery] = None) -> List[Assignment]:
+        """Fetch all assignments for courses with at least one recent due date."""
+        results = list(self.iter_all_assignments(query))
 
         # Sort assignments by due date (undated assignments go to the end)
-        results.sort(key=lambda x: x.due_at or datetime.max.replace(tzinfo=MOUNTAIN_TZ))
+        results.sort(key=due_sort_key)
         return results
+
+    def get_changed_assignments(self, mark_synced: bool = True) -> AssignmentChanges:
+        """
+        Fetch current assignments and compare them with the snapshot from the last sync.
+        Requires a cache_path, which is where the snapshot is kept between runs.
+        Pass mark_synced=False to record the snapshot only once the changes are exported.
+        """
+        if self.cache is None:
+            raise ValueError("get_changed_assignments requires CanvasClient(cache_path=...)")
+
+        previous = self.cache.load_snapshot()
+        current = self.get_all_assignments()
+        current_ids = {a.id for a in current}
+
+        changes = AssignmentChanges(assignments=current)
+        for a in current:
+            if a.id is None or a.id not in previous or previous[a.id] != a.updated_at:
+                changes.changed.append(a)
+        changes.removed_ids = [aid for aid in previous if aid not in current_ids]
+
+        if mark_synced:
+            self.mark_synced(current)
+        return changes
+
+    def mark_synced(self, assignments: List[Assignment]):
+        """Record assignments as the snapshot the next get_changed_assignments compares against."""
+        self.cache.save_snapshot({a.id: a.updated_at for a in assignments if a.id is not None})
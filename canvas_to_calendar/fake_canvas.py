@@ -0,0 +1,205 @@
+"""
+Local stand-in for the parts of the Canvas REST API that CanvasClient uses.
+Serves paginated courses and assignments with an artificial per-request latency,
+answers If-None-Match revalidation with 304 Not Modified, and can emulate
+Canvas's leaky-bucket rate limit.
+"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlencode, urlparse, parse_qs
+
+ASSIGNMENTS_PATH = re.compile(r"^/api/v1/courses/(\d+)/assignments$")
+
+
+def make_assignments(course_id: int, count: int, offset_days: int = -30) -> list:
+    """Generate assignments due every few days from offset_days, with every tenth undated."""
+    now = datetime.now(timezone.utc).replace(hour=6, minute=59, second=0, microsecond=0)
+    assignments = []
+    for i in range(count):
+        due_at = None
+        if i % 10 != 9:
+            due_at = (now + timedelta(days=3 * i + offset_days)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        assignments.append({
+            "id": course_id * 10_000 + i,
+            "course_id": course_id,
+            "name": f"Assignment {i + 1}",
+            "due_at": due_at,
+            "updated_at": "2025-01-01T00:00:00Z",
+            "description": "<p>" + "Lorem ipsum dolor sit amet. " * 20 + "</p>",
+            "points_possible": 10.0,
+            "submission_types": ["online_upload"],
+        })
+    return assignments
+
+
+def filter_bucket(assignments: list, bucket: str) -> list:
+    """Approximate Canvas's date buckets for the subset CanvasClient can request."""
+    now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    week = (datetime.now(timezone.utc) + timedelta(weeks=1)).strftime("%Y-%m-%dT%H:%M:%SZ")
+    if bucket == "undated":
+        return [a for a in assignments if a["due_at"] is None]
+    if bucket == "past":
+        return [a for a in assignments if a["due_at"] and a["due_at"] < now]
+    if bucket == "future":
+        return [a for a in assignments if a["due_at"] is None or a["due_at"] >= now]
+    if bucket == "upcoming":
+        return [a for a in assignments if a["due_at"] and now <= a["due_at"] < week]
+    return assignments
+
+
+def with_all_dates(assignment: dict) -> dict:
+    return dict(assignment, all_dates=[
+        {"id": section, "title": f"Section 00{section}", "due_at": assignment["due_at"],
+         "unlock_at": None, "lock_at": None, "base": section == 1}
+        for section in range(1, 4)
+    ])
+
+
+class FakeCanvas:
+    def __init__(self, courses: int = 12, assignments_per_course: int = 150, latency: float = 0.05,
+                 concluded_courses: int = 0, page_size: int = 100, request_cost: float = 0.0,
+                 bucket_size: float = 700.0, leak_rate: float = 10.0):
+        """
+        The first `concluded_courses` courses ended last semester and have only past due dates.
+        Pages never exceed `page_size` items, whatever per_page asks for. Each request
+        costs `request_cost` units from a bucket of `bucket_size` that refills at
+        `leak_rate` units per second; 0 disables rate limiting.
+        """
+        self.latency = latency
+        self.page_size = page_size
+        self.request_cost = request_cost
+        self.bucket_size = bucket_size
+        self.leak_rate = leak_rate
+        self._bucket = bucket_size
+        self._bucket_updated = time.monotonic()
+        last_semester = (datetime.now(timezone.utc) - timedelta(days=120)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        self.courses = [
+            {"id": cid, "name": f"CS {100 + cid} - Section 00{cid % 3 + 1}",
+             "end_at": last_semester if cid <= concluded_courses else None}
+            for cid in range(1, courses + 1)
+        ]
+        self.assignments = {
+            c["id"]: make_assignments(c["id"], assignments_per_course,
+                                      -600 if c["end_at"] else -30)
+            for c in self.courses
+        }
+        self.request_count = 0
+        self.throttled_count = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> str:
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _spend_rate_limit(self) -> tuple:
+        """Charge one request to the bucket. Returns (allowed, remaining)."""
+        with self._lock:
+            now = time.monotonic()
+            self._bucket = min(self.bucket_size,
+                               self._bucket + (now - self._bucket_updated) * self.leak_rate)
+            self._bucket_updated = now
+            if self._bucket < self.request_cost:
+                self.throttled_count += 1
+                return False, self._bucket
+            self._bucket -= self.request_cost
+            return True, self._bucket
+
+    def _page(self, path: str, items: list, query: dict) -> tuple:
+        per_page = min(int(query.get("per_page", ["10"])[0]), self.page_size)
+        page = int(query.get("page", ["1"])[0])
+        start = (page - 1) * per_page
+        body = items[start:start + per_page]
+        link = None
+        if start + per_page < len(items):
+            next_query = urlencode(dict(query, page=[page + 1], per_page=[per_page]), doseq=True)
+            link = f'<{self.base_url}{path}?{next_query}>; rel="next"'
+        return body, link
+
+    def _make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with fake._lock:
+                    fake.request_count += 1
+                time.sleep(fake.latency)
+
+                allowed, remaining = fake._spend_rate_limit()
+                if not allowed:
+                    payload = b"403 Forbidden (Rate Limit Exceeded)"
+                    self.send_response(403)
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.send_header("X-Rate-Limit-Remaining", f"{remaining:.1f}")
+                    self.end_headers()
+                    self.wfile.write(payload)
+                    return
+
+                parsed = urlparse(self.path)
+                query = parse_qs(parsed.query)
+                match = ASSIGNMENTS_PATH.match(parsed.path)
+                if parsed.path == "/api/v1/courses":
+                    items = fake.courses
+                elif match and int(match.group(1)) in fake.assignments:
+                    items = fake.assignments[int(match.group(1))]
+                    if "bucket" in query:
+                        items = filter_bucket(items, query["bucket"][0])
+                    if "all_dates" in query.get("include[]", []):
+                        items = [with_all_dates(a) for a in items]
+                else:
+                    self.send_error(404)
+                    return
+
+                body, link = fake._page(parsed.path, items, query)
+                payload = json.dumps(body).encode()
+                etag = '"' + hashlib.md5(payload).hexdigest() + '"'
+                if self.headers.get("If-None-Match") == etag:
+                    payload = b""
+                    self.send_response(304)
+                else:
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                with fake._lock:
+                    fake.bytes_sent += len(payload)
+
+                self.send_header("ETag", etag)
+                self.send_header("X-Rate-Limit-Remaining", f"{remaining:.1f}")
+                if link:
+                    self.send_header("Link", link)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,255 @@
+"""
+Stand-ins for Google Tasks. FakeTasksService mimics the discovery service returned
+by get_tasks_service() in-process; FakeTasksServer serves the same tasklist over
+HTTP (list, insert, patch, delete and multipart batch) for a real googleapiclient.
+Each executed request or batch sleeps for `latency` to model one HTTPS round trip.
+"""
+
+import itertools
+import json
+import re
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+TASKS_PATH = re.compile(r"^/tasks/v1/lists/([^/]+)/tasks(?:/([^/]+))?$")
+BATCH_PATHS = {"/batch", "/batch/tasks/v1"}
+
+
+class FakeRequest:
+    def __init__(self, service, method: str, apply):
+        self._service = service
+        self.method = method
+        self._apply = apply
+
+    def execute(self, http=None, num_retries=0):
+        self._service._round_trip()
+        return self._service._call(self.method, self._apply)
+
+
+class FakeBatch:
+    def __init__(self, service, callback):
+        self._service = service
+        self._callback = callback
+        self._requests = []
+
+    def add(self, request, request_id=None, callback=None):
+        self._requests.append((request_id, request))
+
+    def execute(self, http=None):
+        self._service._round_trip()
+        for request_id, request in self._requests:
+            response = self._service._call(request.method, request._apply)
+            self._callback(request_id, response, None)
+
+
+class FakeTasks:
+    def __init__(self, service):
+        self._service = service
+
+    def list(self, tasklist, pageToken=None, maxResults=100, showHidden=False, **kwargs):
+        def apply(store):
+            items = [t for t in store.values() if showHidden or not t.get("hidden")]
+            start = int(pageToken or 0)
+            result = {"items": items[start:start + maxResults]}
+            if start + maxResults < len(items):
+                result["nextPageToken"] = str(start + maxResults)
+            return result
+        return FakeRequest(self._service, "list", apply)
+
+    def insert(self, tasklist, body):
+        def apply(store):
+            task = dict(body, id=str(next(self._service._ids)), status="needsAction")
+            task["due"] = _date_only(task.get("due"))
+            store[task["id"]] = task
+            return task
+        return FakeRequest(self._service, "insert", apply)
+
+    def patch(self, tasklist, task, body):
+        def apply(store):
+            store[task].update(body)
+            store[task]["due"] = _date_only(store[task].get("due"))
+            return store[task]
+        return FakeRequest(self._service, "patch", apply)
+
+    def delete(self, tasklist, task):
+        def apply(store):
+            store.pop(task, None)
+            return ""
+        return FakeRequest(self._service, "delete", apply)
+
+
+def _date_only(due):
+    """Google Tasks keeps only the date part of a due time."""
+    return f"{due[:10]}T00:00:00.000Z" if due else due
+
+
+class FakeTasksService:
+    def __init__(self, latency: float = 0.05):
+        self.latency = latency
+        self.store = {}
+        self.calls = {"list": 0, "insert": 0, "patch": 0, "delete": 0}
+        self.round_trips = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._tasks = FakeTasks(self)
+
+    def tasks(self):
+        return self._tasks
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self, callback)
+
+    def _round_trip(self):
+        with self._lock:
+            self.round_trips += 1
+        time.sleep(self.latency)
+
+    def _call(self, method: str, apply):
+        with self._lock:
+            self.calls[method] += 1
+            return apply(self.store)
+
+    @property
+    def writes(self) -> int:
+        return self.calls["insert"] + self.calls["patch"] + self.calls["delete"]
+
+
+def build_service(base_url: str):
+    """Build a googleapiclient Tasks service whose requests go to a FakeTasksServer at base_url."""
+    import httplib2
+    from googleapiclient.discovery import build_from_document
+    from google_tasks import load_discovery_document
+
+    document = json.loads(load_discovery_document())
+    document["rootUrl"] = f"{base_url}/"
+    return build_from_document(document, http=httplib2.Http())
+
+
+class FakeTasksServer:
+    """HTTP front end over a FakeTasksService; point a client at it with build_service()."""
+
+    def __init__(self, latency: float = 0.05):
+        self.latency = latency
+        self.backend = FakeTasksService(latency=0)
+        self.round_trips = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def calls(self) -> dict:
+        return self.backend.calls
+
+    @property
+    def writes(self) -> int:
+        return self.backend.writes
+
+    def start(self) -> str:
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self.base_url
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def build_service(self):
+        """Build a googleapiclient Tasks service whose requests go to this server."""
+        return build_service(self.base_url)
+
+    def _dispatch(self, method: str, url: str, body: bytes) -> tuple:
+        """Apply one REST call to the backend. Returns (status, JSON-serializable body)."""
+        parsed = urlparse(url)
+        match = TASKS_PATH.match(parsed.path)
+        if not match:
+            return 404, {"error": {"code": 404, "message": "Not Found"}}
+
+        tasklist, task_id = unquote(match.group(1)), match.group(2) and unquote(match.group(2))
+        query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+        tasks = self.backend.tasks()
+        if method == "GET" and task_id is None:
+            request = tasks.list(tasklist, pageToken=query.get("pageToken"),
+                                 maxResults=int(query.get("maxResults", 100)),
+                                 showHidden=query.get("showHidden") == "true")
+        elif method == "POST" and task_id is None:
+            request = tasks.insert(tasklist, json.loads(body))
+        elif method == "PATCH" and task_id in self.backend.store:
+            request = tasks.patch(tasklist, task_id, json.loads(body))
+        elif method == "DELETE" and task_id in self.backend.store:
+            return 204, tasks.delete(tasklist, task_id).execute()
+        else:
+            return 404, {"error": {"code": 404, "message": "Not Found"}}
+        return 200, request.execute()
+
+    def _batch(self, content_type: str, body: bytes) -> tuple:
+        """Run each part of a multipart/mixed batch. Returns (content type, body)."""
+        message = BytesParser().parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+        boundary = uuid.uuid4().hex
+        parts = []
+        for part in message.get_payload():
+            request_line, rest = part.get_payload().split("\n", 1)
+            method, url, _ = request_line.strip().split(" ", 2)
+            sections = re.split(r"\r?\n\r?\n", rest, maxsplit=1)
+            request_body = sections[1].strip() if len(sections) > 1 else ""
+            status, response = self._dispatch(method, url, request_body.encode())
+
+            content_id = part["Content-ID"].strip("<>")
+            payload = "" if status == 204 else json.dumps(response)
+            parts.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status < 300 else 'Error'}\r\n"
+                f"Content-Type: application/json\r\n\r\n{payload}\r\n"
+            )
+        parts.append(f"--{boundary}--\r\n")
+        return f'multipart/mixed; boundary="{boundary}"', "".join(parts).encode()
+
+    def _make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _handle(self):
+                with fake._lock:
+                    fake.round_trips += 1
+                time.sleep(fake.latency)
+
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                if self.command == "POST" and urlparse(self.path).path in BATCH_PATHS:
+                    content_type, payload = fake._batch(self.headers["Content-Type"], body)
+                    status = 200
+                else:
+                    status, response = fake._dispatch(self.command, self.path, body)
+                    content_type = "application/json"
+                    payload = b"" if status == 204 else json.dumps(response).encode()
+
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = do_PATCH = do_DELETE = _handle
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
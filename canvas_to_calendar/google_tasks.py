@@ -1,25 +1,50 @@
-from datetime import timedelta, time
-from typing import Iterable
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, time
+from typing import Dict, Iterable, List, Optional, Tuple
 import os
 import pickle
 import logging
+import re
+import tempfile
 
-from googleapiclient.discovery import build
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.errors import HttpError
-
-from canvas_client import Assignment
+from canvas_client import MOUNTAIN_TZ, RECENT_WINDOW, Assignment
+from tasks_batch import BatchWriter
 
 SCOPES = ["https://www.googleapis.com/auth/tasks"]
+DISCOVERY_CACHE_PATH = "tasks_discovery.json"
 
 logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
 
 
-def get_tasks_service():
+def load_discovery_document() -> Optional[str]:
+    """
+    Return the Tasks v1 discovery document, cached on disk after the first run.
+    Falls back to the copy bundled with googleapiclient, then to None (fetch it).
+    """
+    if os.path.exists(DISCOVERY_CACHE_PATH):
+        with open(DISCOVERY_CACHE_PATH, "r") as f:
+            return f.read()
+
+    from googleapiclient.discovery_cache import get_static_doc
+    document = get_static_doc("tasks", "v1")
+    if document:
+        # Write then rename, so threads building services at once never read a half-written file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(DISCOVERY_CACHE_PATH)), suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(document)
+        os.replace(tmp_path, DISCOVERY_CACHE_PATH)
+    return document
+
+
+def get_tasks_service(token_path: str = "token.json", credentials_path: str = "credentials.json"):
+    # The Google client stack is slow to import, so only load it once an export happens
+    from googleapiclient.discovery import build, build_from_document
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from google.auth.transport.requests import Request
+
     creds = None
-    if os.path.exists("token.json"):
-        with open("token.json", "rb") as f:
+    if os.path.exists(token_path):
+        with open(token_path, "rb") as f:
             creds = pickle.load(f)
 
     if not creds or not creds.valid:
@@ -27,13 +52,17 @@ def get_tasks_service():
             creds.refresh(Request())
         else:
             flow = InstalledAppFlow.from_client_secrets_file(
-                "credentials.json", SCOPES
+                credentials_path, SCOPES
             )
             creds = flow.run_local_server(port=0)
-        with open("token.json", "wb") as f:
+        os.makedirs(os.path.dirname(token_path) or ".", exist_ok=True)
+        with open(token_path, "wb") as f:
             pickle.dump(creds, f)
 
-    return build("tasks", "v1", credentials=creds)
+    document = load_discovery_document()
+    if document:
+        return build_from_document(document, credentials=creds)
+    return build("tasks", "v1", credentials=creds, static_discovery=False)
 
 
 def normalize_due_time(dt: 'datetime') -> 'datetime':
@@ -43,12 +72,14 @@ def normalize_due_time(dt: 'datetime') -> 'datetime':
     return dt
 
 
-def get_existing_tasks(service, tasklist_id="@default"):
+def get_existing_tasks(service, tasklist_id="@default", show_hidden=False):
     """Fetch all tasks from Google Tasks with pagination"""
     tasks = []
     page_token = None
     while True:
-        result = service.tasks().list(tasklist=tasklist_id, pageToken=page_token).execute()
+        result = service.tasks().list(
+            tasklist=tasklist_id, pageToken=page_token, maxResults=100, showHidden=show_hidden
+        ).execute()
         tasks.extend(result.get("items", []))
         page_token = result.get("nextPageToken")
         if not page_token:
@@ -62,90 +93,298 @@ def delete_tasks_by_title(service, titles, tasklist_id="@default"):
     """
     tasks = get_existing_tasks(service, tasklist_id)
     title_set = set(titles)
-    deleted = []
+    batch = BatchWriter(service)
+    titles_by_id = {}
     for task in tasks:
         if "title" in task and task["title"] in title_set:
-            try:
-                service.tasks().delete(tasklist=tasklist_id, task=task["id"]).execute()
-                logging.info(f"Deleted existing task: {task['title']}")
-                deleted.append(task["title"])
-            except HttpError as e:
-                logging.warning(f"Failed to delete '{task['title']}': {e}")
+            batch.add(task["id"], service.tasks().delete(tasklist=tasklist_id, task=task["id"]))
+            titles_by_id[task["id"]] = task["title"]
+
+    result = batch.execute()
+    deleted = []
+    for task_id, title in titles_by_id.items():
+        if task_id in result.responses:
+            logging.info(f"Deleted existing task: {title}")
+            deleted.append(title)
+        else:
+            logging.warning(f"Failed to delete '{title}': {result.errors[task_id]}")
     return deleted
 
 
-def export_assignments_to_tasks(assignments: Iterable[Assignment]):
+# Each managed task carries its Canvas assignment id in the notes so it can be
+# matched on later runs even if the title or due date changes.
+TASK_KEY_PATTERN = re.compile(r"^canvas-id: (\S+)$", re.MULTILINE)
+
+
+@dataclass
+class SyncPlan:
+    """Mutations needed to bring a tasklist in line with the desired tasks."""
+    creates: List[dict] = field(default_factory=list)
+    patches: List[Tuple[dict, dict]] = field(default_factory=list)  # (existing task, changed fields)
+    deletes: List[dict] = field(default_factory=list)
+    unchanged: List[dict] = field(default_factory=list)
+
+
+def task_key(task: dict) -> Optional[str]:
+    """Return the stable key stored in a task's notes, if it is one we manage."""
+    match = TASK_KEY_PATTERN.search(task.get("notes") or "")
+    return match.group(1) if match else None
+
+
+def _assignment_key(a: Assignment) -> str:
+    return str(a.id) if a.id is not None else f"{a.course_name}/{a.name}"
+
+
+def _with_key(notes: str, key: str) -> str:
+    return f"{notes}\n\ncanvas-id: {key}"
+
+
+@dataclass
+class TaskPlan:
+    """Desired task bodies keyed by stable key, computed without touching the API."""
+    tasks: Dict[str, dict] = field(default_factory=dict)
+    earliest_due: Optional[datetime] = None
+    skipped: List[str] = field(default_factory=list)  # undated titles with no date to anchor reminders
+
+
+def plan_tasks(assignments: Iterable[Assignment]) -> TaskPlan:
     """
-    Export assignments to Google Tasks.
-    Deletes existing tasks with matching names, then inserts fresh tasks.
+    Build the desired tasks for the assignments in a single pass.
+    Course short names and the no-due-date reminder schedule are computed once per run.
     """
-    service = get_tasks_service()
-    tasklist_id = "@default"
-
-    # Collect all titles to delete
-    titles_to_delete = []
+    plan = TaskPlan()
+    course_shorts = {}
+    undated = []
 
-    # Standard assignments
     for a in assignments:
-        course_short = a.course_name.split("-")[0].strip()
-        titles_to_delete.append(f"{course_short} — {a.name}")
+        course_short = course_shorts.get(a.course_name)
+        if course_short is None:
+            course_short = course_shorts[a.course_name] = a.course_name.split("-")[0].strip()
+        title = f"{course_short} — {a.name}"
+        key = _assignment_key(a)
 
         if not a.due_at:
-            # For no-due-date assignments, also prepare the 4 reminder titles
-            dated_assignments = [d for d in assignments if d.due_at]
-            if dated_assignments:
-                earliest_due = min(d.due_at for d in dated_assignments)
-                for i in range(4):
-                    reminder_title = f"{course_short} — {a.name} — Reminder {i+1}"
-                    titles_to_delete.append(reminder_title)
-
-    # Delete all existing tasks with these titles
-    logging.info("Deleting any existing tasks with matching titles...")
-    delete_tasks_by_title(service, titles_to_delete, tasklist_id)
+            # No-due-date assignments (extra credit, practice, etc.) wait for earliest_due
+            undated.append((key, title))
+            continue
+
+        if plan.earliest_due is None or a.due_at < plan.earliest_due:
+            plan.earliest_due = a.due_at
+
+        due_local = normalize_due_time(a.due_at)
+        reminder_time = (due_local - timedelta(days=1)).replace(hour=8, minute=0)
+        plan.tasks[key] = {
+            "title": title,
+            "notes": _with_key(f"Due: {due_local.strftime('%Y-%m-%d %H:%M %Z')}", key),
+            "due": reminder_time.isoformat()
+        }
+
+    if plan.earliest_due is None:
+        for key, title in undated:
+            logging.info(f"Skipping no-due-date assignment '{title}' because no dated assignments exist.")
+            plan.skipped.append(title)
+        return plan
+
+    # Every undated assignment shares the same four reminders, spaced 30 days apart
+    reminder_dues = [
+        (plan.earliest_due + timedelta(days=30 * i)).replace(hour=8, minute=0).isoformat()
+        for i in range(4)
+    ]
+    for key, title in undated:
+        for i, due in enumerate(reminder_dues):
+            reminder_key = f"{key}#reminder{i+1}"
+            plan.tasks[reminder_key] = {
+                "title": f"{title} — Reminder {i+1}",
+                "notes": _with_key("No due date assignment — periodic reminder", reminder_key),
+                "due": due
+            }
+
+    return plan
+
+
+def _changed_fields(existing: dict, body: dict) -> dict:
+    changed = {}
+    if existing.get("title") != body["title"]:
+        changed["title"] = body["title"]
+    if existing.get("notes") != body["notes"]:
+        changed["notes"] = body["notes"]
+    # Google Tasks only keeps the date part of "due" and returns it as midnight UTC
+    if (existing.get("due") or "")[:10] != body["due"][:10]:
+        changed["due"] = body["due"]
+    return changed
+
 
+def _outside_window(task: dict, cutoff: Optional[datetime]) -> bool:
+    """Whether a task may only be missing from `desired` because Canvas wasn't asked for it."""
+    if "#reminder" in (task_key(task) or ""):
+        # Undated assignments drop out with their course when it goes quiet
+        return True
+    # Tasks are due the day before their assignment
+    due = (task.get("due") or "")[:10]
+    return not due or cutoff is None or due < (cutoff - timedelta(days=1)).date().isoformat()
+
+
+def plan_sync(desired: Dict[str, dict], existing_tasks: List[dict],
+              cutoff: Optional[datetime] = None) -> SyncPlan:
+    """
+    Diff desired tasks against the tasks already in the list.
+    Tasks created before keys were stored in notes are adopted by title.
+    Completed tasks are never deleted, so finished work stays in the history.
+
+    `desired` only covers assignments due since `cutoff`, so a managed task missing from
+    it is deleted only if its due date is on or after the cutoff, where its assignment
+    would have been fetched had it still existed. Older tasks, no-due-date reminders and
+    tasks without a cutoff are left for the user. Duplicates are always removed.
+    """
+    plan = SyncPlan()
+    by_key = {}
+    by_title = {}
+    extras = []
+    for task in existing_tasks:
+        key = task_key(task)
+        if key is not None:
+            if key in by_key:
+                extras.append(task)
+            else:
+                by_key[key] = task
+        elif task.get("title"):
+            by_title.setdefault(task["title"], []).append(task)
+
+    desired_titles = {body["title"] for body in desired.values()}
+
+    for key, body in desired.items():
+        existing = by_key.pop(key, None)
+        if existing is None and by_title.get(body["title"]):
+            existing = by_title[body["title"]].pop(0)
+
+        if existing is None:
+            plan.creates.append(body)
+            continue
+
+        changed = _changed_fields(existing, body)
+        if changed:
+            plan.patches.append((existing, changed))
+        else:
+            plan.unchanged.append(existing)
+
+    # Managed tasks whose assignment is gone, duplicates, and leftover copies of
+    # legacy tasks that the old delete/reinsert export would have replaced
+    leftovers = [t for t in by_key.values() if not _outside_window(t, cutoff)] + extras
+    for title, tasks in by_title.items():
+        if title in desired_titles:
+            leftovers.extend(tasks)
+    plan.deletes = [t for t in leftovers if t.get("status") != "completed"]
+    return plan
+
+
+def prepare_sync(service, assignments: Iterable[Assignment], tasklist_id="@default") -> SyncPlan:
+    """Plan the tasks for the assignments and diff them against the tasklist."""
+    desired = plan_tasks(assignments).tasks
+    # Tasks completed in the Google apps are hidden, and we need them to keep their state
+    existing = get_existing_tasks(service, tasklist_id, show_hidden=True)
+    plan = plan_sync(desired, existing, cutoff=datetime.now(MOUNTAIN_TZ) - RECENT_WINDOW)
+    logging.info(
+        f"Sync plan: {len(plan.creates)} to create, {len(plan.patches)} to update, "
+        f"{len(plan.deletes)} to delete, {len(plan.unchanged)} unchanged"
+    )
+    return plan
+
+
+def sync_requests(service, plan: SyncPlan, tasklist_id="@default") -> List[Tuple[str, object]]:
+    """Build the unexecuted API requests for a plan, keyed by request id."""
+    tasks = service.tasks()
+    requests = []
+    for task in plan.deletes:
+        requests.append((f"delete:{task['id']}", tasks.delete(tasklist=tasklist_id, task=task["id"])))
+    for task, changed in plan.patches:
+        requests.append((f"patch:{task['id']}", tasks.patch(tasklist=tasklist_id, task=task["id"], body=changed)))
+    for i, body in enumerate(plan.creates):
+        requests.append((f"create:{i}", tasks.insert(tasklist=tasklist_id, body=body)))
+    return requests
+
+
+def summarize_sync(plan: SyncPlan, responses: Dict[str, object], errors: Dict[str, Exception]) -> dict:
+    """Build the export summary from the outcome of each request in sync_requests()."""
     summary = {
         "created": [],
-        "no_due_tasks_created": []
+        "updated": [],
+        "deleted": [],
+        "unchanged": [task["title"] for task in plan.unchanged],
+        "no_due_tasks_created": [],
+        "failed": [],
+        "round_trips_saved": 0
     }
 
-    # Determine earliest assignment for no-due-date reminders
-    dated_assignments = [a for a in assignments if a.due_at]
-    earliest_due = min(a.due_at for a in dated_assignments) if dated_assignments else None
+    for task in plan.deletes:
+        title = task.get("title")
+        request_id = f"delete:{task['id']}"
+        if request_id in responses:
+            logging.info(f"Deleted task: {title}")
+            summary["deleted"].append(title)
+        else:
+            logging.warning(f"Failed to delete '{title}': {errors[request_id]}")
+            summary["failed"].append(title)
 
-    # Insert all tasks fresh
-    for a in assignments:
-        course_short = a.course_name.split("-")[0].strip()
-        title = f"{course_short} — {a.name}"
+    for task, changed in plan.patches:
+        title = changed.get("title", task.get("title"))
+        request_id = f"patch:{task['id']}"
+        if request_id in responses:
+            logging.info(f"Updated task: {title}")
+            summary["updated"].append(title)
+        else:
+            logging.warning(f"Failed to update '{title}': {errors[request_id]}")
+            summary["failed"].append(title)
 
-        if a.due_at:
-            due_local = normalize_due_time(a.due_at)
-            reminder_time = (due_local - timedelta(days=1)).replace(hour=8, minute=0)
+    for i, body in enumerate(plan.creates):
+        request_id = f"create:{i}"
+        if request_id not in responses:
+            logging.warning(f"Failed to create '{body['title']}': {errors[request_id]}")
+            summary["failed"].append(body["title"])
+        elif "#reminder" in task_key(body):
+            logging.info(f"Created no-due-date task: {body['title']}")
+            summary["no_due_tasks_created"].append(body["title"])
+        else:
+            logging.info(f"Created task: {body['title']}")
+            summary["created"].append(body["title"])
 
-            task_body = {
-                "title": title,
-                "notes": f"Due: {due_local.strftime('%Y-%m-%d %H:%M %Z')}",
-                "due": reminder_time.isoformat()
-            }
-            service.tasks().insert(tasklist=tasklist_id, body=task_body).execute()
-            logging.info(f"Created task: {title}")
-            summary["created"].append(title)
+    return summary
 
-        else:
-            # No-due-date assignments (extra credit, practice, etc.)
-            if not earliest_due:
-                logging.info(f"Skipping no-due-date assignment '{title}' because no dated assignments exist.")
-                continue
-
-            for i in range(4):
-                reminder_time = (earliest_due + timedelta(days=30 * i)).replace(hour=8, minute=0)
-                no_due_title = f"{title} — Reminder {i+1}"
-                task_body = {
-                    "title": no_due_title,
-                    "notes": "No due date assignment — periodic reminder",
-                    "due": reminder_time.isoformat()
-                }
-                service.tasks().insert(tasklist=tasklist_id, body=task_body).execute()
-                logging.info(f"Created no-due-date task: {no_due_title}")
-                summary["no_due_tasks_created"].append(no_due_title)
 
+def export_assignments_to_tasks(assignments: Iterable[Assignment], service=None,
+                                tasklist_id: str = "@default"):
+    """
+    Export assignments to Google Tasks.
+    Reconciles the tasklist against the assignments, creating, patching and
+    deleting only the tasks that differ. A steady-state sync makes no writes.
+    """
+    service = service or get_tasks_service()
+
+    plan = prepare_sync(service, assignments, tasklist_id)
+    batch = BatchWriter(service)
+    for request_id, request in sync_requests(service, plan, tasklist_id):
+        batch.add(request_id, request)
+    result = batch.execute()
+
+    summary = summarize_sync(plan, result.responses, result.errors)
+    summary["round_trips_saved"] = result.round_trips_saved
+    logging.info(f"Sent {result.calls} task requests in {result.round_trips} batch round trips")
     return summary
+
+
+def sync_changes(canvas, service=None, tasklist_id: str = "@default", changes=None):
+    """
+    Export the assignments that changed since the last sync and advance the client's
+    snapshot. Pass `changes` if they were already fetched. Returns (changes, summary,
+    synced); summary is None when nothing changed.
+    """
+    if changes is None:
+        changes = canvas.get_changed_assignments(mark_synced=False)
+    if not changes.has_changes:
+        return changes, None, False
+
+    summary = export_assignments_to_tasks(changes.assignments, service=service, tasklist_id=tasklist_id)
+    if summary["failed"]:
+        # Keep the old snapshot so the next sync sees the same changes and retries the failed writes
+        return changes, summary, False
+    canvas.mark_synced(changes.assignments)
+    return changes, summary, True
@@ -1,39 +1,87 @@
+import argparse
+
 from canvas_client import CanvasClient
-from google_tasks import export_assignments_to_tasks
+from fetch_assignments import print_report
+from google_tasks import sync_changes
+from watch import SyncWatcher
+
+CACHE_PATH = "canvas_cache.sqlite3"
+STATUS_PATH = "sync_status.json"
+
+def print_summary(summary: dict):
+    print("\nGoogle Tasks export summary:")
+    if summary["created"]:
+        print(f"Created tasks ({len(summary['created'])}):")
+        for t in summary["created"]:
+            print(f"  - {t}")
+    if summary["updated"]:
+        print(f"Updated tasks ({len(summary['updated'])}):")
+        for t in summary["updated"]:
+            print(f"  - {t}")
+    if summary["no_due_tasks_created"]:
+        print(f"No due date reminders created ({len(summary['no_due_tasks_created'])}):")
+        for t in summary["no_due_tasks_created"]:
+            print(f"  - {t}")
+    if summary["deleted"]:
+        print(f"Deleted tasks ({len(summary['deleted'])}):")
+        for t in summary["deleted"]:
+            print(f"  - {t}")
+    if summary["failed"]:
+        print(f"Failed tasks ({len(summary['failed'])}):")
+        for t in summary["failed"]:
+            print(f"  - {t}")
+    print(f"Unchanged tasks: {len(summary['unchanged'])}")
+    print(f"Round trips saved by batching: {summary['round_trips_saved']}")
 
-def main():
-    canvas = CanvasClient()
-    assignments = canvas.get_all_assignments()
+def main(watch: bool = False, interval: float = 300, max_interval: float = 3600, report: bool = False):
+    canvas = CanvasClient(cache_path=CACHE_PATH)
+
+    if report:
+        print_report(canvas.get_all_assignments())
+        return
+
+    if watch:
+        watcher = SyncWatcher(canvas, interval, max_interval, status_path=STATUS_PATH)
+        try:
+            watcher.run()
+        except KeyboardInterrupt:
+            print(f"\nStopped after {watcher.stats.polls} polls, {watcher.stats.exports} exports")
+        return
+
+    changes = canvas.get_changed_assignments(mark_synced=False)
+    assignments = changes.assignments
 
     if len(assignments) == 0:
         print("No current assignments found")
         return
 
+    if not changes.has_changes:
+        print("No assignment changes since last sync")
+        return
+
     print("Fetched assignments:")
     for a in assignments:
         due_str = a.due_at.strftime("%Y-%m-%d %H:%M %Z") if a.due_at else "No due date"
         print(f"{a.course_name} — {a.name} | Due: {due_str}")
 
     try:
-        summary = export_assignments_to_tasks(assignments)
-        print("\nGoogle Tasks export summary:")
-        if summary["created"]:
-            print(f"Created tasks ({len(summary['created'])}):")
-            for t in summary["created"]:
-                print(f"  - {t}")
-        if summary["updated"]:
-            print(f"Updated tasks ({len(summary['updated'])}):")
-            for t in summary["updated"]:
-                print(f"  - {t}")
-        if summary["no_due_tasks_created"]:
-            print(f"No due date reminders created ({len(summary['no_due_tasks_created'])}):")
-            for t in summary["no_due_tasks_created"]:
-                print(f"  - {t}")
+        _, summary, synced = sync_changes(canvas, changes=changes)
+        print_summary(summary)
 
+        if not synced:
+            print(f"\n{len(summary['failed'])} task writes failed; they will be retried on the next run.")
+            return
         print("\nTasks successfully exported to Google Tasks.")
     except Exception as e:
         print(f"Error exporting tasks: {e}")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--watch', action='store_true', help='keep running and poll Canvas for changes')
+    parser.add_argument('--interval', type=float, default=300, help='seconds between polls after a change')
+    parser.add_argument('--max-interval', type=float, default=3600, help='longest wait while idle')
+    parser.add_argument('--report', action='store_true', help='print due dates without exporting')
+
+    args = parser.parse_args()
+    main(args.watch, args.interval, args.max_interval, args.report)
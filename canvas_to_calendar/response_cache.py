@@ -0,0 +1,83 @@
+"""
+On-disk cache of Canvas responses (for conditional requests) and of the
+assignments seen on the last sync.
+"""
+
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    next_url TEXT,
+    body TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshot (
+    assignment_id INTEGER PRIMARY KEY,
+    updated_at TEXT
+);
+"""
+
+
+@dataclass
+class CachedResponse:
+    etag: Optional[str]
+    last_modified: Optional[str]
+    next_url: Optional[str]
+    body: str
+
+    def conditional_headers(self) -> dict:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    def __init__(self, path: str = "canvas_cache.sqlite3"):
+        self.path = path
+        # CanvasClient fetches courses from worker threads, so share one
+        # connection behind a lock rather than one per thread.
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.executescript(SCHEMA)
+
+    def get(self, url: str) -> Optional[CachedResponse]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, next_url, body FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+        return CachedResponse(*row) if row else None
+
+    def put(self, url: str, response: CachedResponse):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (url, etag, last_modified, next_url, body) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (url, response.etag, response.last_modified, response.next_url, response.body),
+            )
+
+    def load_snapshot(self) -> Dict[int, Optional[str]]:
+        """Return assignment id -> updated_at as of the last sync."""
+        with self._lock:
+            rows = self._conn.execute("SELECT assignment_id, updated_at FROM snapshot").fetchall()
+        return dict(rows)
+
+    def save_snapshot(self, snapshot: Dict[int, Optional[str]]):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM snapshot")
+            self._conn.executemany(
+                "INSERT INTO snapshot (assignment_id, updated_at) VALUES (?, ?)",
+                snapshot.items(),
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
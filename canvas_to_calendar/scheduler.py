@@ -0,0 +1,240 @@
+"""
+Syncs several students at once: each account pairs a Canvas token with Google
+credentials and a tasklist. Accounts run in parallel on a thread pool, each with its
+own Canvas session, response cache and Tasks service, while clients for the same
+Canvas host share one connection pool and one cap on requests in flight.
+"""
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+import requests
+
+from canvas_client import CanvasClient
+from google_tasks import get_tasks_service, sync_changes
+
+WRITE_KEYS = ("created", "updated", "deleted", "no_due_tasks_created")
+
+
+@dataclass
+class AccountConfig:
+    name: str
+    canvas_token: str
+    canvas_base_url: Optional[str] = None  # defaults to settings.CANVAS_BASE_URL
+    tasklist_id: str = "@default"
+    token_path: Optional[str] = None  # defaults to tokens/<name>.json, so accounts never share a Google login
+    credentials_path: str = "credentials.json"
+    cache_path: Optional[str] = None  # defaults to canvas_cache_<name>.sqlite3
+
+    def __post_init__(self):
+        self.token_path = self.token_path or os.path.join("tokens", f"{self.name}.json")
+        self.cache_path = self.cache_path or f"canvas_cache_{self.name}.sqlite3"
+
+
+def load_accounts(path: str) -> List[AccountConfig]:
+    """Read a JSON list of accounts (or {"accounts": [...]}) into AccountConfigs."""
+    with open(path) as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data["accounts"]
+    return [AccountConfig(**entry) for entry in data]
+
+
+@dataclass
+class AccountResult:
+    name: str
+    assignments: int = 0
+    changed: int = 0
+    writes: int = 0
+    failed: int = 0
+    latency: float = 0.0
+    error: Optional[str] = None
+
+
+@dataclass
+class SchedulerStats:
+    wall_time: float = 0.0
+    results: List[AccountResult] = field(default_factory=list)
+
+    @property
+    def succeeded(self) -> int:
+        return sum(1 for r in self.results if r.error is None)
+
+    @property
+    def assignments(self) -> int:
+        return sum(r.assignments for r in self.results)
+
+    @property
+    def writes(self) -> int:
+        return sum(r.writes for r in self.results)
+
+    @property
+    def parallelism(self) -> float:
+        """Account-seconds of work done per second of wall time."""
+        return sum(r.latency for r in self.results) / self.wall_time if self.wall_time else 0.0
+
+    def summary(self) -> dict:
+        wall = self.wall_time or float("inf")
+        return {
+            "accounts": len(self.results),
+            "succeeded": self.succeeded,
+            "failed": len(self.results) - self.succeeded,
+            "assignments": self.assignments,
+            "writes": self.writes,
+            "wall_time": round(self.wall_time, 3),
+            "accounts_per_second": round(len(self.results) / wall, 2),
+            "assignments_per_second": round(self.assignments / wall, 1),
+            "parallelism": round(self.parallelism, 2),
+            "slowest": max(self.results, key=lambda r: r.latency).name if self.results else None,
+        }
+
+
+def _default_service(account: AccountConfig):
+    return get_tasks_service(account.token_path, account.credentials_path)
+
+
+class SyncScheduler:
+    def __init__(self, accounts: List[AccountConfig], max_workers: int = 4,
+                 host_concurrency: int = 16, fetch_workers: int = 4,
+                 service_factory: Callable[[AccountConfig], object] = _default_service):
+        self.accounts = accounts
+        self.max_workers = max(1, max_workers)
+        self.host_concurrency = max(1, host_concurrency)
+        # Per-account fan-out stays below the host cap so one large account can't starve the rest
+        self.fetch_workers = max(1, min(fetch_workers, self.host_concurrency))
+        self.service_factory = service_factory
+
+        self._lock = threading.Lock()
+        self._adapters: Dict[str, requests.adapters.HTTPAdapter] = {}
+        self._slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._clients: Dict[str, CanvasClient] = {}
+        self._services: Dict[str, object] = {}
+        self._last_latency: Dict[str, float] = {}
+
+    def _host_resources(self, base_url: str):
+        """The connection pool and request slots shared by every client for this host."""
+        host = urlparse(base_url).netloc
+        with self._lock:
+            if host not in self._adapters:
+                self._adapters[host] = requests.adapters.HTTPAdapter(pool_maxsize=self.host_concurrency)
+                self._slots[host] = threading.BoundedSemaphore(self.host_concurrency)
+            return self._adapters[host], self._slots[host]
+
+    def client_for(self, account: AccountConfig) -> CanvasClient:
+        """The account's Canvas client, created on first use and kept for later runs."""
+        client = self._clients.get(account.name)
+        if client is None:
+            base_url = account.canvas_base_url
+            if base_url is None:
+                import settings
+                base_url = settings.CANVAS_BASE_URL
+            adapter, slots = self._host_resources(base_url)
+            client = CanvasClient(base_url, account.canvas_token, max_workers=self.fetch_workers,
+                                  cache_path=account.cache_path, adapter=adapter, request_slots=slots)
+            self._clients[account.name] = client
+        return client
+
+    def service_for(self, account: AccountConfig):
+        service = self._services.get(account.name)
+        if service is None:
+            service = self._services[account.name] = self.service_factory(account)
+        return service
+
+    def sync_account(self, account: AccountConfig) -> AccountResult:
+        """Sync one account. Errors are recorded on the result rather than raised."""
+        result = AccountResult(account.name)
+        start = time.perf_counter()
+        try:
+            canvas = self.client_for(account)
+            changes, summary, synced = sync_changes(canvas, service=self.service_for(account),
+                                                    tasklist_id=account.tasklist_id)
+            result.assignments = len(changes.assignments)
+            result.changed = len(changes.changed) + len(changes.removed_ids)
+
+            if summary is not None:
+                result.writes = sum(len(summary[key]) for key in WRITE_KEYS)
+                result.failed = len(summary["failed"])
+                if not synced:
+                    result.error = f"{result.failed} task writes failed"
+        except Exception as e:
+            logging.warning(f"Sync failed for {account.name}: {e}")
+            result.error = str(e)
+
+        result.latency = time.perf_counter() - start
+        self._last_latency[account.name] = result.latency
+        return result
+
+    def run_once(self) -> SchedulerStats:
+        """Sync every account once, longest-running accounts first."""
+        # Starting the slowest accounts first keeps them from finishing alone at the end
+        accounts = sorted(self.accounts, key=lambda a: self._last_latency.get(a.name, 0.0), reverse=True)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            results = list(pool.map(self.sync_account, accounts))
+
+        stats = SchedulerStats(time.perf_counter() - start, results)
+        logging.info(
+            f"Synced {stats.succeeded}/{len(results)} accounts in {stats.wall_time:.2f}s "
+            f"({stats.assignments} assignments, {stats.writes} writes)"
+        )
+        return stats
+
+    def run(self, interval: float = 300, stop: Optional[threading.Event] = None):
+        """Sync all accounts every `interval` seconds until `stop` is set."""
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            stats = self.run_once()
+            print(json.dumps(stats.summary()))
+            stop.wait(interval)
+
+    def close(self):
+        for client in self._clients.values():
+            if client.cache:
+                client.cache.close()
+            client.session.close()
+
+
+def print_stats(stats: SchedulerStats):
+    print(f"\n{'account':24} {'assignments':>11} {'changed':>8} {'writes':>7} {'seconds':>8}  status")
+    for r in stats.results:
+        status = "ok" if r.error is None else f"error: {r.error}"
+        print(f"{r.name:24} {r.assignments:>11} {r.changed:>8} {r.writes:>7} {r.latency:>8.2f}  {status}")
+    print(json.dumps(stats.summary(), indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sync several Canvas accounts into Google Tasks")
+    parser.add_argument('accounts', help='JSON file listing the accounts to sync')
+    parser.add_argument('--workers', type=int, default=4, help='accounts synced at the same time')
+    parser.add_argument('--host-concurrency', type=int, default=16,
+                        help='Canvas requests in flight per host across all accounts')
+    parser.add_argument('--fetch-workers', type=int, default=4, help='concurrent course fetches per account')
+    parser.add_argument('--interval', type=float, help='keep running, syncing every INTERVAL seconds')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    scheduler = SyncScheduler(load_accounts(args.accounts), args.workers,
+                              args.host_concurrency, args.fetch_workers)
+    try:
+        if args.interval:
+            scheduler.run(args.interval)
+        else:
+            stats = scheduler.run_once()
+            if args.json:
+                print(json.dumps({"summary": stats.summary(),
+                                  "accounts": [asdict(r) for r in stats.results]}, indent=2))
+            else:
+                print_stats(stats)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        scheduler.close()
@@ -0,0 +1,114 @@
+"""
+Groups Google Tasks API calls into HTTP batch requests.
+Only calls that fail with a retryable error are resent, with exponential backoff.
+"""
+
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple
+
+if TYPE_CHECKING:
+    from googleapiclient.errors import HttpError
+
+MAX_BATCH_SIZE = 1000  # Google's limit on calls per batch request
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+RETRYABLE_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+
+
+def is_retryable(error: 'HttpError') -> bool:
+    status = error.resp.status
+    if status in RETRYABLE_STATUSES:
+        return True
+    # Google reports some rate limiting as 403 with a reason instead of 429
+    if status == 403:
+        details = error.error_details if isinstance(error.error_details, list) else []
+        return any(d.get("reason") in RETRYABLE_REASONS for d in details if isinstance(d, dict))
+    return False
+
+
+@dataclass
+class BatchResult:
+    responses: Dict[str, Any] = field(default_factory=dict)
+    errors: Dict[str, 'HttpError'] = field(default_factory=dict)
+    calls: int = 0        # logical API calls, including retries
+    round_trips: int = 0  # HTTP requests actually sent
+
+    @property
+    def round_trips_saved(self) -> int:
+        return self.calls - self.round_trips
+
+
+class BatchWriter:
+    def __init__(self, service, batch_size: int = MAX_BATCH_SIZE, max_retries: int = 4,
+                 backoff: float = 1.0):
+        self.service = service
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._pending: List[Tuple[str, Any]] = []
+
+    def add(self, request_id: str, request):
+        """Queue an unexecuted request, e.g. service.tasks().insert(...)."""
+        self._pending.append((request_id, request))
+
+    def __len__(self):
+        return len(self._pending)
+
+    def execute(self) -> BatchResult:
+        """Send every queued request, retrying retryable failures until max_retries."""
+        result = BatchResult()
+        pending, self._pending = self._pending, []
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                delay = self.backoff * 2 ** (attempt - 1)
+                logging.info(f"Retrying {len(pending)} failed task requests in {delay:.1f}s")
+                time.sleep(delay)
+
+            failed = []
+            for start in range(0, len(pending), self.batch_size):
+                chunk = pending[start:start + self.batch_size]
+                failed.extend(self._execute_chunk(chunk, result))
+
+            pending = failed
+            if not pending:
+                break
+
+        for request_id, _ in pending:
+            logging.warning(f"Giving up on task request {request_id}: {result.errors[request_id]}")
+        return result
+
+    def _execute_chunk(self, chunk: List[Tuple[str, Any]], result: BatchResult) -> List[Tuple[str, Any]]:
+        """Execute one batch and return the requests that should be retried."""
+        from googleapiclient.errors import HttpError
+
+        requests_by_id = dict(chunk)
+        retry = []
+
+        def callback(request_id, response, exception):
+            if exception is None:
+                result.responses[request_id] = response
+                result.errors.pop(request_id, None)
+                return
+            result.errors[request_id] = exception
+            if isinstance(exception, HttpError) and is_retryable(exception):
+                retry.append((request_id, requests_by_id[request_id]))
+
+        batch = self.service.new_batch_http_request(callback=callback)
+        for request_id, request in chunk:
+            batch.add(request, request_id=request_id)
+        try:
+            batch.execute()
+        except HttpError as e:
+            # The batch request itself was throttled or failed, so none of its calls ran
+            if not is_retryable(e):
+                raise
+            result.round_trips += 1
+            for request_id, _ in chunk:
+                result.errors[request_id] = e
+            return list(chunk)
+
+        result.calls += len(chunk)
+        result.round_trips += 1
+        return retry
@@ -0,0 +1,99 @@
+"""
+Long-running sync loop: keeps one Canvas session and one Google Tasks service
+warm, and polls Canvas less often while nothing is changing.
+"""
+
+import json
+import logging
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Optional
+
+from canvas_client import CanvasClient
+from google_tasks import get_tasks_service, sync_changes
+
+
+@dataclass
+class SyncStats:
+    polls: int = 0
+    exports: int = 0
+    errors: int = 0
+    last_poll_at: Optional[str] = None
+    last_latency: Optional[float] = None  # seconds for the last poll, export included
+    last_changed: int = 0
+    last_removed: int = 0
+    last_summary: dict = field(default_factory=dict)  # counts per summary category
+    next_interval: Optional[float] = None
+
+
+class SyncWatcher:
+    def __init__(self, canvas: CanvasClient, interval: float = 300, max_interval: float = 3600,
+                 backoff: float = 2.0, status_path: Optional[str] = None):
+        self.canvas = canvas
+        self.interval = interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.status_path = status_path
+        self.stats = SyncStats(next_interval=interval)
+        self._service = None
+
+    @property
+    def service(self):
+        """The Tasks service, built on the first export and reused after that."""
+        if self._service is None:
+            self._service = get_tasks_service()
+        return self._service
+
+    def sync_once(self) -> bool:
+        """Poll Canvas and export if anything changed. Returns whether it exported every change."""
+        start = time.perf_counter()
+        changes, summary, exported = sync_changes(self.canvas, service=self.service)
+
+        if summary is not None:
+            self.stats.exports += 1
+            self.stats.last_summary = {
+                key: len(value) if isinstance(value, list) else value
+                for key, value in summary.items()
+            }
+            if not exported:
+                self.stats.errors += 1
+                logging.warning(f"{len(summary['failed'])} task writes failed; retrying on the next poll")
+
+        self.stats.polls += 1
+        self.stats.last_poll_at = datetime.now().isoformat(timespec="seconds")
+        self.stats.last_latency = time.perf_counter() - start
+        self.stats.last_changed = len(changes.changed)
+        self.stats.last_removed = len(changes.removed_ids)
+        return exported
+
+    def _write_status(self):
+        if self.status_path:
+            with open(self.status_path, "w") as f:
+                json.dump(asdict(self.stats), f, indent=2)
+
+    def run(self, stop: Optional[threading.Event] = None):
+        """Poll until `stop` is set, backing off up to max_interval while idle or failing."""
+        stop = stop or threading.Event()
+        interval = self.interval
+
+        while not stop.is_set():
+            try:
+                if self.sync_once():
+                    interval = self.interval
+                else:
+                    interval = min(interval * self.backoff, self.max_interval)
+                logging.info(
+                    f"Sync {self.stats.polls}: {self.stats.last_changed} changed, "
+                    f"{self.stats.last_removed} removed in {self.stats.last_latency:.2f}s; "
+                    f"next poll in {interval:.0f}s"
+                )
+            except Exception as e:
+                self.stats.errors += 1
+                interval = min(interval * self.backoff, self.max_interval)
+                logging.warning(f"Sync failed, retrying in {interval:.0f}s: {e}")
+
+            self.stats.next_interval = interval
+            self._write_status()
+            stop.wait(interval)
@@ -0,0 +1,104 @@
+import logging
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import yaml
+
+STAT_ABBREVIATIONS = {
+    'strength': 'STR', 'dexterity': 'DEX', 'constitution': 'CON',
+    'intelligence': 'INT', 'wisdom': 'WIS', 'charisma': 'CHA',
+}
+
+
+@dataclass
+class Character:
+    name: str
+    block: str  # compact one-paragraph sheet that goes into the prompt
+    pattern: re.Pattern  # matches the name, first or last name, or an alias in an event
+
+
+def _items(value) -> List[str]:
+    """Non-empty entries of a YAML list (or a single value) as strings."""
+    values = value if isinstance(value, list) else [value]
+    return [str(v).strip() for v in values if v not in (None, '')]
+
+
+def compile_character(sheet: dict) -> Character:
+    if not isinstance(sheet, dict):
+        raise TypeError(f"a character sheet must be a mapping, not {type(sheet).__name__}")
+    name = str(sheet['name']).strip()
+    parts = []
+
+    stats = sheet.get('stats') or {}
+    if not isinstance(stats, dict):
+        raise TypeError(f"stats of {name} must be a mapping, not {type(stats).__name__}")
+    if stats:
+        parts.append(', '.join(f"{STAT_ABBREVIATIONS.get(stat, stat.upper())} {value}" for stat, value in stats.items()))
+    for key, value in sheet.items():
+        if key in ('name', 'stats', 'aliases'):
+            continue
+        entries = _items(value)
+        if entries:
+            parts.append(f"{key.replace('_', ' ').title()}: {'; '.join(entries)}")
+
+    # The full name, each part of it and any aliases, longest first so the regex prefers them
+    names = {name, *(part for part in name.split() if len(part) > 2), *_items(sheet.get('aliases'))}
+    alternatives = '|'.join(re.escape(n) for n in sorted(names, key=len, reverse=True))
+    pattern = re.compile(rf"\b(?:{alternatives})\b", re.IGNORECASE)
+
+    block = f"{name}: " + '. '.join(parts) + '.' if parts else name
+    return Character(name, block, pattern)
+
+
+class CharacterIndex:
+    """
+    Character sheets from a directory of YAML files (each with a `characters:` list),
+    compiled once into compact prompt blocks. Files are re-read only when their mtime
+    changes, so edits between turns are picked up without reparsing the whole party.
+    """
+
+    def __init__(self, directory: str = 'characters'):
+        self.directory = Path(directory)
+        self._files: Dict[Path, float] = {}
+        self._characters: Dict[Path, List[Character]] = {}
+        self.refresh()
+
+    def refresh(self) -> bool:
+        """Reload added or modified sheets and drop deleted ones. Returns whether anything changed."""
+        current = {path: path.stat().st_mtime for path in sorted(self.directory.glob('*.yaml'))}
+        changed = False
+        for path in set(self._files) - set(current):
+            del self._characters[path]
+            changed = True
+        for path, mtime in current.items():
+            if self._files.get(path) == mtime:
+                continue
+            try:
+                with open(path) as f:
+                    data = yaml.safe_load(f) or {}
+                if not isinstance(data, dict):
+                    raise TypeError(f"expected a mapping with a characters list, not {type(data).__name__}")
+                self._characters[path] = [compile_character(sheet) for sheet in data.get('characters') or []]
+            except (OSError, yaml.YAMLError, KeyError, TypeError) as e:
+                logging.warning(f"Skipping character file {path}: {e}")
+                self._characters[path] = []
+            changed = True
+        self._files = current
+        return changed
+
+    @property
+    def characters(self) -> List[Character]:
+        return [c for path in sorted(self._characters) for c in self._characters[path]]
+
+    def involved(self, event: str) -> List[Character]:
+        self.refresh()
+        return [c for c in self.characters if c.pattern.search(event)]
+
+    def context_for(self, event: str) -> Optional[str]:
+        """Sheets for just the characters the event mentions, or None if it mentions nobody."""
+        involved = self.involved(event)
+        if not involved:
+            return None
+        return "Characters involved:\n" + '\n'.join(c.block for c in involved)
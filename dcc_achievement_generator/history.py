@@ -0,0 +1,132 @@
+import json
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+# Rough tokens-per-character ratio for English text; close enough for budgeting
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(item) -> int:
+    """Approximate token count of a message dict, response output item or string."""
+    if isinstance(item, str):
+        text = item
+    elif isinstance(item, dict):
+        text = json.dumps(item, default=str)
+    elif hasattr(item, 'model_dump_json'):
+        text = item.model_dump_json(exclude_none=True)
+    else:
+        text = str(item)
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+@dataclass
+class Turn:
+    event: str
+    items: list = field(default_factory=list)
+    achievement: Optional[str] = None  # one-line record of what was awarded
+    tokens: int = 0
+
+    def add(self, item):
+        self.items.append(item)
+        self.tokens += estimate_tokens(item)
+
+
+def _describe_achievement(output_text: str) -> Optional[str]:
+    try:
+        fields = json.loads(output_text)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(fields, dict) or not fields.get('achievement_title'):
+        return None
+    line = fields['achievement_title']
+    reward = fields.get('reward')
+    if isinstance(reward, dict):
+        line += f" [{reward.get('tier', '?')}: {reward.get('box_name', 'box')}]"
+    return line
+
+
+class ConversationHistory:
+    """
+    Conversation sent with each request: the fixed system prompt, a compact list of
+    achievements from older turns, and the last `keep_turns` turns verbatim. Turns are
+    compacted early when the verbatim part would exceed `token_budget`. Messages are
+    ordered from least to most likely to change so the provider's prompt cache can
+    reuse the longest possible prefix.
+    """
+
+    def __init__(self, system_prompt: str = '', keep_turns: int = 6, token_budget: int = 4000,
+                 event_chars: int = 80):
+        self.system_prompt = system_prompt
+        self.keep_turns = max(1, keep_turns)
+        self.token_budget = token_budget
+        self.event_chars = event_chars
+        self._turns: List[Turn] = []
+        self._awarded: List[str] = []
+        self._compacted_tokens = 0  # verbatim tokens of every turn folded into the summary
+
+    def clear(self):
+        """Forget the conversation but keep the system prompt."""
+        self._turns.clear()
+        self._awarded.clear()
+        self._compacted_tokens = 0
+
+    def add_user(self, message: str):
+        turn = Turn(message)
+        turn.add({'role': 'user', 'content': message})
+        self._turns.append(turn)
+
+    def add_response(self, output: list, output_text: str = ''):
+        """Record the model's output for the current turn and compact older turns."""
+        turn = self._turns[-1]
+        for item in output:
+            turn.add(item)
+        turn.achievement = _describe_achievement(output_text)
+        self._compact()
+
+    def _compact(self):
+        # The newest turn always stays verbatim, even if it alone is over budget
+        while len(self._turns) > 1 and (
+            len(self._turns) > self.keep_turns
+            or sum(t.tokens for t in self._turns) > self.token_budget
+        ):
+            turn = self._turns.pop(0)
+            self._compacted_tokens += turn.tokens
+            event = turn.event if len(turn.event) <= self.event_chars else turn.event[:self.event_chars - 1] + '…'
+            self._awarded.append(f"- {event} → {turn.achievement or 'no achievement'}")
+
+        # The summary has to fit the budget too; the oldest entries go first
+        while self._awarded and estimate_tokens(self.summary()) > self.token_budget // 2:
+            self._awarded.pop(0)
+
+    def summary(self) -> str:
+        if not self._awarded:
+            return ''
+        return (
+            "Earlier in this session (event → achievement awarded). "
+            "Do not award the same achievement twice:\n" + '\n'.join(self._awarded)
+        )
+
+    def messages(self, turn_context: Optional[str] = None) -> list:
+        """
+        The input for the next request. `turn_context` is sent just before the current
+        turn and not kept, so it doesn't change the cached prefix or grow the history.
+        """
+        messages = []
+        if self.system_prompt:
+            messages.append({'role': 'system', 'content': self.system_prompt})
+        summary = self.summary()
+        if summary:
+            messages.append({'role': 'system', 'content': summary})
+        for turn in self._turns[:-1]:
+            messages.extend(turn.items)
+        if turn_context:
+            messages.append({'role': 'system', 'content': turn_context})
+        if self._turns:
+            messages.extend(self._turns[-1].items)
+        return messages
+
+    @property
+    def saved_tokens(self) -> int:
+        """Estimated input tokens the next request avoids compared to sending every turn."""
+        summary = self.summary()
+        return max(0, self._compacted_tokens - (estimate_tokens(summary) if summary else 0))
@@ -0,0 +1,90 @@
+"""
+Load test for the web chat handlers against the stub model. Each simulated player gets
+its own session and sends events back to back, with at most `concurrency` replies being
+generated at once like the Gradio queue, and the run reports turns per second for each
+player count. Throughput should grow with players until the concurrency limit is reached.
+
+    python load_test.py --users 1 2 4 8 16 --concurrency 8
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from typing import List
+
+from metrics import RollingWindow
+from main import ChatAgent, session_handlers
+from stub_client import StubAsyncOpenAI
+
+EVENTS = [
+    "Killed a goblin boss with a frying pan",
+    "Fell into a pit trap and survived",
+    "Convinced a shopkeeper to give a discount",
+    "Tamed a feral cat in the dungeon",
+    "Opened a silver box",
+]
+
+
+async def simulate(users: int, turns: int = 5, concurrency: int = 8, latency: float = 0.5,
+                   stream: bool = False, model: str = 'gpt-5-nano') -> dict:
+    client = StubAsyncOpenAI(latency=latency, jitter=latency / 10, seed=users)
+    agent = ChatAgent(model, "You award achievements.", client=client)
+    get_response, stream_response = session_handlers(agent)
+    slots = asyncio.Semaphore(concurrency)
+    waits = RollingWindow(users * turns)
+    sessions = []
+
+    async def player(number: int):
+        session = None
+        for turn in range(turns):
+            message = f"Player {number}: {EVENTS[turn % len(EVENTS)]}"
+            start = time.perf_counter()
+            async with slots:
+                if stream:
+                    async for _, _, session in stream_response(message, [], session):
+                        pass
+                else:
+                    _, _, session = await get_response(message, [], session)
+            waits.add(time.perf_counter() - start)
+        sessions.append(session)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(player(number) for number in range(users)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        'users': users,
+        'turns': users * turns,
+        'seconds': round(elapsed, 2),
+        'turns_per_second': round(users * turns / elapsed, 2),
+        'latency_p50': round(waits.quantile(0.5), 3),
+        'latency_p95': round(waits.quantile(0.95), 3),
+        'max_in_flight': client.responses.max_in_flight,
+        # Every session should hold only its own player's turns
+        'sessions_isolated': all(session.metrics.calls == turns for session in sessions)
+                             and agent.metrics.calls == users * turns,
+    }
+
+
+def run(user_counts: List[int], turns: int, concurrency: int, latency: float, stream: bool) -> List[dict]:
+    return [asyncio.run(simulate(users, turns, concurrency, latency, stream)) for users in user_counts]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, nargs='+', default=[1, 2, 4, 8, 16], help='player counts to try')
+    parser.add_argument('--turns', type=int, default=5, help='events each player sends')
+    parser.add_argument('--concurrency', type=int, default=8, help='replies generated at once')
+    parser.add_argument('--latency', type=float, default=0.5, help='seconds per stub model call')
+    parser.add_argument('--stream', action='store_true')
+    parser.add_argument('--json', action='store_true', help='print one JSON object per run')
+    args = parser.parse_args()
+
+    for result in run(args.users, args.turns, args.concurrency, args.latency, args.stream):
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print(f"{result['users']:>3} users: {result['turns_per_second']:>6.2f} turns/s, "
+                  f"p50 {result['latency_p50']:.2f}s, p95 {result['latency_p95']:.2f}s, "
+                  f"{result['max_in_flight']} in flight, isolated={result['sessions_isolated']}")
@@ -1,69 +1,264 @@
 import argparse
 import asyncio
+import copy
+import hashlib
+import json
 import sys
-from typing import Optional, List
+import time
+from typing import AsyncIterator, Optional, List, Tuple
 
 import gradio as gr
+import httpx
 
-from openai import AsyncOpenAI
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 from pathlib import Path
-from pydantic import BaseModel, Field
+from pydantic_core import from_json
 
+from characters import CharacterIndex
+from history import ConversationHistory
+from metrics import Metrics
+from models import AchievementModel, BoxModel, RewardModel
+from response_cache import ResponseCache
+from reward_pool import TIERS, RewardPool, match_tier
+from router import ModelRouter, Route
 from usage import print_usage, format_usage_markdown
 
-class RewardModel(BaseModel):
-    name: str
-    description: str = Field(description="The quality of the reward depends on reward_tier. This description is for flavor purposes")
-    benefits: str = Field(description="D&D style functionality descriptions")
 
-class BoxModel(BaseModel):
-    tier: str = Field(description="'bronze', 'silver', 'gold', 'platinum' or 'legendary'")
-    box_name: str
-    box_contents: List[RewardModel] = Field(description="The reward itself. There can be multiple small rewards")
+def parse_partial(text: str) -> dict:
+    """Best-effort parse of a partially streamed AchievementModel JSON object."""
+    try:
+        fields = from_json(text, allow_partial='trailing-strings')
+    except ValueError:
+        return {}
+    return fields if isinstance(fields, dict) else {}
+
+
+def format_achievement(fields: dict) -> str:
+    """Render (possibly partial) AchievementModel fields as markdown."""
+    lines = []
+    if fields.get('achievement_title'):
+        lines.append(f"**{fields['achievement_title']}**")
+    if fields.get('achievement_desc'):
+        lines.append(fields['achievement_desc'])
+    reward = fields.get('reward')
+    if isinstance(reward, dict):
+        header = reward.get('box_name') or 'Reward'
+        if reward.get('tier'):
+            header += f" ({reward['tier']})"
+        lines.append(f"**{header}**")
+        for item in reward.get('box_contents') or []:
+            if not isinstance(item, dict):
+                continue
+            entry = f"- **{item.get('name', '')}**"
+            if item.get('description'):
+                entry += f": {item['description']}"
+            if item.get('benefits'):
+                entry += f"\n  *{item['benefits']}*"
+            lines.append(entry)
+    return '\n\n'.join(lines)
+
+
+def default_cache_key(prompt: str) -> str:
+    return 'dcc-' + hashlib.sha256(prompt.encode()).hexdigest()[:16]
+
+
+def character_context(characters: Optional[CharacterIndex], event: str) -> Optional[str]:
+    return characters.context_for(event) if characters else None
 
-class AchievementModel(BaseModel):
-    achievement_title: str
-    achievement_desc: str
-    reward: Optional[BoxModel] = Field(None, description="Easy achievements don't always include a reward")
 
 class ChatAgent:
-    def __init__(self, model: str, prompt: str):
-        self._ai = AsyncOpenAI()
-        self.usage = []
+    def __init__(self, model: str, prompt: str, keep_turns: int = 6, history_budget: int = 4000,
+                 characters: Optional[CharacterIndex] = None, campaign: Optional[str] = None,
+                 pool_size: int = 0, pool_budget: float = 0.05, pool_path: str = 'reward_pool.json',
+                 client=None, cache: Optional[ResponseCache] = None, metrics: Optional[Metrics] = None,
+                 router: Optional[ModelRouter] = None):
+        self._ai = client or AsyncOpenAI()
+        self.metrics = metrics or Metrics()
+        self._turn_saved = 0  # estimated input tokens history compaction saves on this turn
         self.model = model
         self.reasoning = {'effort': 'low'}
+        self.router = router or ModelRouter(model, self.reasoning['effort'])
         self._prompt = prompt
-        self._history = []
-        if prompt:
-            self._history.append({'role': 'system', 'content': prompt})
+        self._history = ConversationHistory(prompt, keep_turns, history_budget)
+        self.characters = characters
+        # Requests with the same key are routed to the same cache; default to one key per prefix
+        self.prompt_cache_key = campaign or default_cache_key(prompt)
+        self.pool = RewardPool(
+            self._ai, model, prompt, pool_path, per_tier=pool_size, spend_cap=pool_budget,
+            reasoning=self.reasoning, prompt_cache_key=self.prompt_cache_key, metrics=self.metrics,
+            router=self.router,
+        ) if pool_size else None
+        self.cache = cache
+        self._turn_context: Optional[str] = None  # sheets of the characters in the current event
+        self._turn_route = self.router.default  # model and reasoning effort for the current event
 
-    async def get_response(self, user_message: str):
+    def new_session(self) -> 'ChatAgent':
+        """A ChatAgent with its own history and usage that shares this one's client, caches and pool."""
+        session = copy.copy(self)
+        session._history = ConversationHistory(self._prompt, self._history.keep_turns, self._history.token_budget)
+        session.metrics = Metrics(self.metrics.window, parent=self.metrics)
+        session._turn_saved = 0
+        session._turn_context = None
+        session._turn_route = self.router.default
+        return session
+
+    def _cache_context(self) -> str:
+        """Everything besides the message itself that shapes a cacheable reply."""
+        route = self._turn_route
+        return ResponseCache.context_hash(route.model, json.dumps(route.reasoning), self._prompt,
+                                          self._turn_context or '')
+
+    def _start_turn(self, user_message: str) -> list:
+        self._history.add_user(user_message)
+        self._turn_saved = self._history.saved_tokens
+        return self._history.messages(self._turn_context)
+
+    async def _local_response(self, user_message: str) -> Optional[str]:
+        """Handle commands, pooled rewards and cached replies that don't need a model call."""
         if user_message == "clear":
             self._history.clear()
             return "History cleared."
 
-        self._history.append({'role': 'user', 'content': user_message})
+        self._turn_context = character_context(self.characters, user_message)
+        self._turn_route = self.router.route(user_message)
+        text = await self._pool_response(user_message)
+        if text is None and self.cache:
+            hit = self.cache.get(user_message, self._cache_context())
+            text = hit[0] if hit else None
+        if text is not None:
+            self._history.add_user(user_message)
+            self._history.add_response([{'role': 'assistant', 'content': text}], text)
+        return text
+
+    async def _pool_response(self, user_message: str) -> Optional[str]:
+        command, _, arg = user_message.strip().lower().partition(' ')
+        if command == 'instant' and self.pool is None:
+            return "The reward pool is off; start with --pool-size to use instant rewards."
+        if self.pool is None:
+            return None
+
+        if command == 'instant' and not arg:
+            # Any tier that's ready, cheapest first
+            tier = next((t for t in TIERS if self.pool.size(t)), TIERS[0])
+        else:
+            tier = match_tier(user_message)
+        if tier is None:
+            return None
+
+        box = await self.pool.get(tier)
+        if box is None:
+            # Let the event go to the model as a normal turn instead
+            return None
+        return AchievementModel(
+            achievement_title=f"{tier.title()} reward",
+            achievement_desc=f"A {tier} box from the reward pool.",
+            reward=box,
+        ).model_dump_json()
+
+    def _end_turn(self, user_message: str, response, route: Route, start: float, ttft: Optional[float] = None):
+        self.metrics.record(route.model, response.usage, time.perf_counter() - start, ttft,
+                            route=route.label('chat'), history_saved=self._turn_saved)
+        self._history.add_response(response.output, response.output_text)
+        if self.cache and response.output_text:
+            self.cache.put(user_message, self._cache_context(), response.output_text)
+        if self.pool:
+            # Top the pool up while the table reads the reply
+            self.pool.schedule_refill()
 
-        response = await self._ai.responses.parse(
-            input=self._history,
-            model=self.model,
-            reasoning=self.reasoning,
+    async def get_response(self, user_message: str):
+        local = await self._local_response(user_message)
+        if local is not None:
+            return local
+
+        start = time.perf_counter()
+        response, route = await self.router.parse(
+            self._ai, self._turn_route,
+            input=self._start_turn(user_message),
+            prompt_cache_key=self.prompt_cache_key,
             text_format=AchievementModel
         )
-        self.usage.append(response.usage)
-        self._history.extend(
-            response.output
-        )
+        self._end_turn(user_message, response, route, start)
         return response.output_text
 
+    async def stream_response(self, user_message: str) -> AsyncIterator[Tuple[str, dict]]:
+        """Like get_response, but yields (text so far, partially parsed fields) as tokens arrive."""
+        local = await self._local_response(user_message)
+        if local is not None:
+            yield local, parse_partial(local)
+            return
+
+        start = time.perf_counter()
+        text = ''
+        ttft = None
+        async for route, delta, final in self.router.stream(
+            self._ai, self._turn_route,
+            input=self._start_turn(user_message),
+            prompt_cache_key=self.prompt_cache_key,
+            text_format=AchievementModel
+        ):
+            if final is not None:
+                response = final
+                break
+            if not text:
+                ttft = time.perf_counter() - start
+            text += delta
+            yield text, parse_partial(text)
+
+        self._end_turn(user_message, response, route, start, ttft)
+        yield response.output_text, parse_partial(response.output_text)
+
     def __enter__(self):
         return self
 
+    def usage_markdown(self) -> str:
+        return format_usage_markdown(self.model, self.metrics, self.cache.stats if self.cache else None)
+
     def __exit__(self, exc_type, exc_val, exc_tb):
-        print_usage(self.model, self.usage)
+        print_usage(self.model, self.metrics, cache_stats=self.cache.stats if self.cache else None)
+        self.metrics.close()
+        if self.cache:
+            self.cache.close()
+        if self.pool:
+            self.pool.save()
+            print(self.pool.report(), file=sys.stderr)
+        if self.router.tier_routes or self.router.fallbacks:
+            print(self.router.report(), file=sys.stderr)
+
+
+def make_client(stub: bool = False, connections: int = 100):
+    """The client every session and task shares, so they reuse one pool of keep-alive connections."""
+    if stub:
+        from stub_client import StubAsyncOpenAI
+        return StubAsyncOpenAI()
+    return AsyncOpenAI(http_client=DefaultAsyncHttpxClient(
+        limits=httpx.Limits(max_connections=connections, max_keepalive_connections=connections)))
+
+
+def session_handlers(agent: ChatAgent):
+    """
+    Chat handlers taking (message, chat history, session) and returning the reply, the usage
+    markdown and the session. Each browser session gets its own ChatAgent from
+    agent.new_session() on its first message, so tabs never see each other's history.
+    """
+    async def get_response(message, chat_view_history, session: Optional[ChatAgent]):
+        session = session or agent.new_session()
+        response = await session.get_response(message)
+        return response, session.usage_markdown(), session
 
+    async def stream_response(message, chat_view_history, session: Optional[ChatAgent]):
+        session = session or agent.new_session()
+        usage_content = session.usage_markdown()
+        reply = ''
+        async for text, fields in session.stream_response(message):
+            reply = format_achievement(fields) or text
+            yield reply, usage_content, session
+        # Usage is only known once the stream completes
+        yield reply, session.usage_markdown(), session
 
-def _gradio_loop(agent):
+    return get_response, stream_response
+
+
+def _gradio_loop(agent, stream: bool = False, concurrency_limit: int = 8, max_queue: int = 64):
     # Constrain width with CSS and center
     css = """
     /* limit overall Gradio app width and center it */
@@ -76,13 +271,11 @@ def _gradio_loop(agent):
     }
     """
 
-    usage_view = gr.Markdown(format_usage_markdown(agent.model, []))
+    usage_view = gr.Markdown(agent.new_session().usage_markdown())
+    get_response, stream_response = session_handlers(agent)
 
     with gr.Blocks(css=css, theme=gr.themes.Monochrome()) as demo:
-        async def get_response(message, chat_view_history):
-            response = await agent.get_response(message)
-            usage_content = format_usage_markdown(agent.model, agent.usage)
-            return response, usage_content
+        session = gr.State(None)
 
         with gr.Row():
             with gr.Column(scale=5):
@@ -93,41 +286,233 @@ def _gradio_loop(agent):
                 )
                 chat = gr.ChatInterface(
                     chatbot=bot,
-                    fn=get_response,
-                    additional_outputs=[usage_view]
+                    fn=stream_response if stream else get_response,
+                    additional_inputs=[session],
+                    additional_outputs=[usage_view, session],
+                    concurrency_limit=concurrency_limit,
                 )
 
             with gr.Column(scale=1):
                 usage_view.render()
 
+    # Requests past the concurrency limit wait in the queue; past max_queue they're turned away
+    demo.queue(max_size=max_queue, default_concurrency_limit=concurrency_limit)
     demo.launch()
 
 
-async def _terminal_loop(agent: ChatAgent):
+async def _terminal_loop(agent: ChatAgent, stream: bool = False):
+    if agent.pool:
+        agent.pool.schedule_refill()
     while True:
-        message = input("User: ")
+        # Read input off the event loop so background reward pool refills keep running
+        message = await asyncio.to_thread(input, "User: ")
         if not message:
             break
-        response = await agent.get_response(message)
-        print('Agent:', response)
+        if not stream:
+            response = await agent.get_response(message)
+            print('Agent:', response)
+            continue
+
+        print('Agent: ', end='', flush=True)
+        shown = 0
+        async for text, _ in agent.stream_response(message):
+            # The last item repeats the full text, so only print what hasn't been shown
+            print(text[shown:], end='', flush=True)
+            shown = max(shown, len(text))
+        print()
+
+
+def read_events(path: str) -> List[str]:
+    """One event per line, skipping blanks and # comments. JSONL files use each line's "prompt"."""
+    events = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            events.append(json.loads(line)['prompt'] if path.endswith('.jsonl') else line)
+    return events
+
+
+def _batch_input(prompt: str, characters: Optional[CharacterIndex], event: str) -> list:
+    # Same layout as an interactive turn, so batch and chat requests share cached prefixes
+    history = ConversationHistory(prompt)
+    history.add_user(event)
+    return history.messages(character_context(characters, event))
+
+
+async def generate_batch(client, model: str, prompt: str, characters: Optional[CharacterIndex], events: List[str],
+                         concurrency: int = 8, reasoning: Optional[dict] = None,
+                         cache_key: Optional[str] = None, metrics: Optional[Metrics] = None,
+                         router: Optional[ModelRouter] = None) -> Tuple[List[dict], Metrics]:
+    """
+    Generate one achievement per event, at most `concurrency` requests at a time.
+    Returns one result row per event, in order, and the metrics of every successful call.
+    """
+    reasoning = reasoning or {'effort': 'low'}
+    router = router or ModelRouter(model, reasoning['effort'])
+    cache_key = cache_key or default_cache_key(prompt)
+    semaphore = asyncio.Semaphore(concurrency)
+    metrics = metrics or Metrics()
+
+    async def generate(index: int, event: str) -> dict:
+        row = {'index': index, 'event': event}
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response, route = await router.parse(
+                    client, router.route(event),
+                    input=_batch_input(prompt, characters, event),
+                    prompt_cache_key=cache_key,
+                    text_format=AchievementModel
+                )
+                achievement = response.output_parsed or AchievementModel.model_validate_json(response.output_text)
+            except Exception as e:
+                row['error'] = str(e)
+                return row
+        latency = time.perf_counter() - start
+        metrics.record(route.model, response.usage, latency, route=route.label('batch'))
+        row['achievement'] = achievement.model_dump()
+        row['model'] = route.model
+        row['latency'] = round(latency, 3)
+        return row
 
+    rows = await asyncio.gather(*(generate(i, event) for i, event in enumerate(events)))
+    return list(rows), metrics
 
-def main(model: str, web: bool):
+
+def write_batch_requests(path: str, model: str, prompt: str, characters: Optional[CharacterIndex], events: List[str],
+                         reasoning: Optional[dict] = None, cache_key: Optional[str] = None,
+                         router: Optional[ModelRouter] = None):
+    """Write a Batch API input file with one /v1/responses request per event."""
+    # The SDK's own conversion from a pydantic model to a strict json_schema text format
+    from openai.lib._parsing._responses import type_to_text_format_param
+
+    text_format = type_to_text_format_param(AchievementModel)
+    router = router or ModelRouter(model, (reasoning or {'effort': 'low'})['effort'])
+    with open(path, 'w') as f:
+        for index, event in enumerate(events):
+            request = {
+                'custom_id': f'event-{index}',
+                'method': 'POST',
+                'url': '/v1/responses',
+                'body': {
+                    **router.route(event).request(),
+                    'input': _batch_input(prompt, characters, event),
+                    'prompt_cache_key': cache_key or default_cache_key(prompt),
+                    'text': {'format': text_format},
+                },
+            }
+            f.write(json.dumps(request) + '\n')
+
+
+def batch(model: str, events_path: str, out_path: str, *, concurrency: int = 8, offline: bool = False,
+          stub: bool = False, character_dir: str = 'characters', campaign: Optional[str] = None,
+          trace_path: Optional[str] = None, router: Optional[ModelRouter] = None):
+    with open("sys_prompt.md", "r") as f:
+        prompt = f.read()
+    characters = CharacterIndex(character_dir)
+    events = read_events(events_path)
+
+    if offline:
+        write_batch_requests(out_path, model, prompt, characters, events, cache_key=campaign, router=router)
+        print(f"Wrote {len(events)} Batch API requests to {out_path}; upload it with purpose='batch'",
+              file=sys.stderr)
+        return
+
+    client = make_client(stub, concurrency)
+    start = time.perf_counter()
+    rows, metrics = asyncio.run(generate_batch(client, model, prompt, characters, events, concurrency,
+                                               cache_key=campaign, metrics=Metrics(trace_path=trace_path),
+                                               router=router))
+    elapsed = time.perf_counter() - start
+
+    with open(out_path, 'w') as f:
+        for row in rows:
+            f.write(json.dumps(row) + '\n')
+
+    failed = sum(1 for row in rows if 'error' in row)
+    print(f"Generated {len(rows) - failed}/{len(rows)} achievements in {elapsed:.2f}s "
+          f"({len(rows) / elapsed:.1f}/s) -> {out_path}", file=sys.stderr)
+    print_usage(model, metrics)
+    if router:
+        print(router.report(), file=sys.stderr)
+    metrics.close()
+
+
+def main(model: str, web: bool, *, stream: bool = False, keep_turns: int = 6, history_budget: int = 4000,
+         character_dir: str = 'characters', campaign: Optional[str] = None,
+         pool_size: int = 0, pool_budget: float = 0.05, cache_path: Optional[str] = None,
+         similarity: float = 0.8, trace_path: Optional[str] = None, metrics_port: Optional[int] = None,
+         concurrency_limit: int = 8, max_queue: int = 64, stub: bool = False,
+         router: Optional[ModelRouter] = None):
     with open("sys_prompt.md", "r") as f:
         prompt = f.read()
+    characters = CharacterIndex(character_dir)
+    cache = ResponseCache(cache_path, threshold=similarity or None) if cache_path else None
+    metrics = Metrics(trace_path=trace_path)
+    if metrics_port:
+        metrics.serve(metrics_port)
+
+    client = make_client(stub, concurrency_limit)
 
-    with ChatAgent(model, prompt) as agent:
+    with ChatAgent(model, prompt, keep_turns, history_budget, characters, campaign,
+                   pool_size, pool_budget, client=client, cache=cache, metrics=metrics, router=router) as agent:
         if web:
-            _gradio_loop(agent)
+            _gradio_loop(agent, stream, concurrency_limit, max_queue)
         else:
-            asyncio.run(_terminal_loop(agent))
+            asyncio.run(_terminal_loop(agent, stream))
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    # parser.add_argument('character_file', type=str)
     parser.add_argument('--web', action='store_true')
     parser.add_argument('--model', default='gpt-5-nano')
+    parser.add_argument('--stream', action='store_true', help='show replies as they are generated')
+    parser.add_argument('--keep-turns', type=int, default=6, help='recent turns sent verbatim')
+    parser.add_argument('--history-budget', type=int, default=4000,
+                        help='approximate token budget for the conversation history')
+    parser.add_argument('--characters', default='characters',
+                        help='directory of character sheet YAML files; only characters an event names are sent')
+    parser.add_argument('--campaign', help='prompt cache key shared by every session of a campaign')
+    parser.add_argument('--pool-size', type=int, default=0,
+                        help='pre-generated reward boxes to keep ready per tier (0 disables the pool)')
+    parser.add_argument('--pool-budget', type=float, default=0.05, help='USD cap on reward pool generation')
+    parser.add_argument('--response-cache', metavar='PATH',
+                        help='reuse replies to repeated events from this SQLite file')
+    parser.add_argument('--similarity', type=float, default=0.8,
+                        help='similarity needed to reuse a reply to a different wording (0 for exact matches only)')
+    parser.add_argument('--trace', metavar='PATH', help='append a JSONL record of every model call')
+    parser.add_argument('--metrics-port', type=int, help='serve Prometheus metrics at localhost:PORT/metrics')
+    parser.add_argument('--batch', metavar='EVENTS', help='generate one achievement per line of EVENTS and exit')
+    parser.add_argument('--out', default='achievements.jsonl', help='output file for --batch')
+    parser.add_argument('--concurrency', type=int, default=8, help='requests in flight for --batch')
+    parser.add_argument('--offline', action='store_true',
+                        help='with --batch, write a Batch API request file to --out instead of calling the API')
+    parser.add_argument('--stub', action='store_true', help='use the local stub model instead of the API')
+    parser.add_argument('--concurrency-limit', type=int, default=8,
+                        help='with --web, replies generated at once across all sessions')
+    parser.add_argument('--max-queue', type=int, default=64,
+                        help='with --web, requests allowed to wait for a free slot before new ones are refused')
+
+    parser.add_argument('--route', action='store_true',
+                        help='pick the model and reasoning effort by the reward tier an event asks for '
+                             '("gold", "a legendary box", "... earns a silver reward"; a bare tier word '
+                             'like "silver key" does not count), falling back to cheaper models on '
+                             'timeouts and rate limits')
+    parser.add_argument('--timeout', type=float, default=30.0,
+                        help='with --route, seconds to wait on a model (to the first token when streaming) '
+                             'before falling back')
 
     args = parser.parse_args()
-    main(args.model, args.web)
+    router = ModelRouter.by_tier(args.model, timeout=args.timeout) if args.route else None
+    if args.batch:
+        batch(args.model, args.batch, args.out, concurrency=args.concurrency, offline=args.offline,
+              stub=args.stub, character_dir=args.characters, campaign=args.campaign, trace_path=args.trace,
+              router=router)
+        sys.exit()
+    main(args.model, args.web, stream=args.stream, keep_turns=args.keep_turns, history_budget=args.history_budget,
+         character_dir=args.characters, campaign=args.campaign, pool_size=args.pool_size,
+         pool_budget=args.pool_budget, cache_path=args.response_cache, similarity=args.similarity,
+         trace_path=args.trace, metrics_port=args.metrics_port, concurrency_limit=args.concurrency_limit,
+         max_queue=args.max_queue, stub=args.stub, router=router)
@@ -0,0 +1,235 @@
+import bisect
+import json
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+from usage import PRICING, _calculate_cost_usd
+
+TOKEN_KINDS = ('input', 'cached', 'output', 'reasoning')
+
+
+@dataclass(slots=True)
+class CallRecord:
+    timestamp: float
+    model: str
+    route: str  # what the call was for: 'chat', 'batch', 'pool', ...
+    latency: float  # wall seconds for the whole call
+    ttft: Optional[float]  # seconds to the first streamed output token
+    input: int
+    cached: int
+    output: int
+    reasoning: int
+    cost: float
+    history_saved: int = 0  # estimated input tokens history compaction kept out of this call
+
+
+class RollingWindow:
+    """The last `size` values, kept sorted for quantiles, with a running sum."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.total = 0.0
+        self._values = deque()
+        self._sorted = []
+
+    def add(self, value: float):
+        if len(self._values) == self.size:
+            old = self._values.popleft()
+            del self._sorted[bisect.bisect_left(self._sorted, old)]
+            self.total -= old
+        self._values.append(value)
+        bisect.insort(self._sorted, value)
+        self.total += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self._sorted:
+            return None
+        # Nearest-rank quantile
+        index = max(0, min(len(self._sorted) - 1, int(q * len(self._sorted) + 0.5) - 1))
+        return self._sorted[index]
+
+    def __len__(self):
+        return len(self._values)
+
+
+class Metrics:
+    """
+    Per-call latency, token and cost records. Totals and rolling windows are updated as
+    each call is recorded, so reading them costs the same however long the session runs.
+    Records can be appended to a JSONL trace and served in Prometheus text format.
+    With a `parent`, every record is also added to it, so per-session metrics roll up.
+    """
+
+    def __init__(self, window: int = 200, trace_path: Optional[str] = None, parent: Optional['Metrics'] = None):
+        self.window = window
+        self.parent = parent
+        self.started = time.time()
+        self.calls = 0
+        self.totals = dict.fromkeys(TOKEN_KINDS, 0)
+        self.cost = 0.0
+        self.cache_saved_usd = 0.0
+        self.history_saved = 0
+        self.history_saved_usd = 0.0
+        self.latency_sum = 0.0
+        self.last: Optional[CallRecord] = None
+        self.last_by_route: Dict[str, CallRecord] = {}
+        self.last_chat: Optional[CallRecord] = None  # the last chat turn, whatever route it took
+        self.routes: Dict[str, Dict[str, float]] = {}
+        self.latency = RollingWindow(window)
+        self.ttft = RollingWindow(window)
+        self._window_output = RollingWindow(window)
+        self._lock = threading.Lock()
+        self._trace = open(trace_path, 'a') if trace_path else None
+
+    @classmethod
+    def from_usages(cls, model: str, usages: list) -> 'Metrics':
+        """Metrics for a plain list of response.usage objects, without latencies."""
+        metrics = cls()
+        for usage in usages:
+            metrics.record(model, usage, latency=0.0)
+        return metrics
+
+    def record(self, model: str, usage, latency: float, ttft: Optional[float] = None,
+               route: str = 'chat', history_saved: int = 0) -> CallRecord:
+        """Add one model call, given its response.usage."""
+        tokens = {
+            'input': usage.input_tokens,
+            'cached': usage.input_tokens_details.cached_tokens,
+            'output': usage.output_tokens,
+            'reasoning': usage.output_tokens_details.reasoning_tokens,
+        }
+        record = CallRecord(time.time(), model, route, latency, ttft, cost=_calculate_cost_usd(model, tokens),
+                            history_saved=history_saved, **tokens)
+        self.add(record)
+        return record
+
+    def add(self, record: CallRecord):
+        tokens = {kind: getattr(record, kind) for kind in TOKEN_KINDS}
+        history_saved, latency, ttft, route = record.history_saved, record.latency, record.ttft, record.route
+        rates = PRICING.get(record.model)
+
+        with self._lock:
+            self.calls += 1
+            for kind in TOKEN_KINDS:
+                self.totals[kind] += tokens[kind]
+            self.cost += record.cost
+            self.history_saved += history_saved
+            if rates:
+                self.cache_saved_usd += tokens['cached'] * (rates['input'] - rates.get('cached', rates['input'])) / 1_000_000
+                self.history_saved_usd += history_saved * rates['input'] / 1_000_000
+            self.latency_sum += latency
+            route_totals = self.routes.setdefault(route, {'calls': 0, 'cost': 0.0, 'latency': 0.0})
+            route_totals['calls'] += 1
+            route_totals['cost'] += record.cost
+            route_totals['latency'] += latency
+
+            self.latency.add(latency)
+            self._window_output.add(tokens['output'])
+            if ttft is not None:
+                self.ttft.add(ttft)
+            self.last = self.last_by_route[route] = record
+            if route == 'chat' or route.startswith('chat:'):
+                self.last_chat = record
+
+            if self._trace:
+                self._trace.write(json.dumps(asdict(record)) + '\n')
+                self._trace.flush()
+        if self.parent:
+            self.parent.add(record)
+
+    @property
+    def cache_hit_ratio(self) -> float:
+        return self.totals['cached'] / self.totals['input'] if self.totals['input'] else 0.0
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        """Output tokens per second of model time over the rolling window."""
+        return self._window_output.total / self.latency.total if self.latency.total else None
+
+    @property
+    def cost_per_hour(self) -> float:
+        hours = (time.time() - self.started) / 3600
+        return self.cost / hours if hours else 0.0
+
+    def summary(self) -> dict:
+        return {
+            'calls': self.calls,
+            **self.totals,
+            'cost_usd': round(self.cost, 6),
+            'cost_usd_per_hour': round(self.cost_per_hour, 4),
+            'cache_hit_ratio': round(self.cache_hit_ratio, 3),
+            'latency_p50': self.latency.quantile(0.5),
+            'latency_p95': self.latency.quantile(0.95),
+            'ttft_p50': self.ttft.quantile(0.5),
+            'ttft_p95': self.ttft.quantile(0.95),
+            'tokens_per_second': self.tokens_per_second,
+            'routes': self.routes,
+        }
+
+    def prometheus(self) -> str:
+        """The current metrics in the Prometheus text exposition format."""
+        lines = []
+
+        def metric(name, kind, help, samples):
+            lines.append(f'# HELP dcc_{name} {help}')
+            lines.append(f'# TYPE dcc_{name} {kind}')
+            for labels, value in samples:
+                if value is not None:
+                    lines.append(f'dcc_{name}{labels} {value}')
+
+        with self._lock:
+            metric('calls_total', 'counter', 'Model calls made.',
+                   [(f'{{route="{route}"}}', totals['calls']) for route, totals in self.routes.items()])
+            metric('tokens_total', 'counter', 'Tokens used, by kind.',
+                   [(f'{{kind="{kind}"}}', value) for kind, value in self.totals.items()])
+            metric('cost_usd_total', 'counter', 'Estimated spend in USD.',
+                   [(f'{{route="{route}"}}', totals['cost']) for route, totals in self.routes.items()])
+            metric('latency_seconds', 'summary', f'Call latency over the last {self.window} calls.', [
+                ('{quantile="0.5"}', self.latency.quantile(0.5)),
+                ('{quantile="0.95"}', self.latency.quantile(0.95)),
+                ('_sum', self.latency_sum),
+                ('_count', self.calls),
+            ])
+            metric('ttft_seconds', 'gauge', f'Time to first token over the last {self.window} streamed calls.', [
+                ('{quantile="0.5"}', self.ttft.quantile(0.5)),
+                ('{quantile="0.95"}', self.ttft.quantile(0.95)),
+            ])
+            metric('output_tokens_per_second', 'gauge', 'Output tokens per second of model time.',
+                   [('', self.tokens_per_second)])
+            metric('cost_usd_per_hour', 'gauge', 'Spend rate since the session started.', [('', self.cost_per_hour)])
+            metric('prompt_cache_hit_ratio', 'gauge', 'Share of input tokens served from the prompt cache.',
+                   [('', self.cache_hit_ratio)])
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port: int, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+        """Serve prometheus() at /metrics from a background thread."""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def close(self):
+        if self._trace:
+            self._trace.close()
+            self._trace = None
@@ -0,0 +1,18 @@
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+class RewardModel(BaseModel):
+    name: str
+    description: str = Field(description="The quality of the reward depends on reward_tier. This description is for flavor purposes")
+    benefits: str = Field(description="D&D style functionality descriptions")
+
+class BoxModel(BaseModel):
+    tier: str = Field(description="'bronze', 'silver', 'gold', 'platinum' or 'legendary'")
+    box_name: str
+    box_contents: List[RewardModel] = Field(description="The reward itself. There can be multiple small rewards")
+
+class AchievementModel(BaseModel):
+    achievement_title: str
+    achievement_desc: str
+    reward: Optional[BoxModel] = Field(None, description="Easy achievements don't always include a reward")
@@ -0,0 +1,188 @@
+import hashlib
+import re
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+NUM_PERM = 64
+BANDS = 16  # LSH bands of NUM_PERM // BANDS rows; more bands find less similar candidates
+SHINGLE_CHARS = 4
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+_WORD = re.compile(r"[a-z0-9']+")
+# Ignored when comparing messages for similarity, so "killed the boss" matches "killed a boss"
+STOPWORDS = frozenset("a an the of to in on at for with and or my our his her their its is was were".split())
+
+
+def normalize(message: str) -> str:
+    """Lowercase and drop punctuation and extra whitespace."""
+    return ' '.join(_WORD.findall(message.lower()))
+
+
+def _permutations(count: int) -> List[Tuple[int, int]]:
+    # Derived from a fixed seed so signatures stay comparable across runs
+    params = []
+    for i in range(count):
+        digest = hashlib.sha256(f'minhash-{i}'.encode()).digest()
+        a, b = struct.unpack('<QQ', digest[:16])
+        params.append((a % (MERSENNE_PRIME - 1) + 1, b % MERSENNE_PRIME))
+    return params
+
+
+_PERMUTATIONS = _permutations(NUM_PERM)
+
+
+def minhash(text: str) -> List[int]:
+    """MinHash signature over the character shingles of normalized text, minus stopwords."""
+    text = ' ' + ' '.join(word for word in text.split() if word not in STOPWORDS) + ' '
+    shingles = {zlib.crc32(text[i:i + SHINGLE_CHARS].encode())
+                for i in range(max(1, len(text) - SHINGLE_CHARS + 1))}
+    return [
+        min(((a * s + b) % MERSENNE_PRIME) & MAX_HASH for s in shingles)
+        for a, b in _PERMUTATIONS
+    ]
+
+
+def similarity(sig_a: List[int], sig_b: List[int]) -> float:
+    """Estimated Jaccard similarity of the texts behind two signatures."""
+    return sum(x == y for x, y in zip(sig_a, sig_b)) / len(sig_a)
+
+
+def _band_keys(signature: List[int]) -> List[str]:
+    rows = len(signature) // BANDS
+    return [
+        f"{band}:" + hashlib.blake2b(struct.pack(f'<{rows}I', *signature[band * rows:(band + 1) * rows]),
+                                     digest_size=8).hexdigest()
+        for band in range(BANDS)
+    ]
+
+
+@dataclass
+class CacheStats:
+    exact_hits: int = 0
+    similar_hits: int = 0
+    misses: int = 0
+    evicted: int = 0
+
+    @property
+    def hits(self) -> int:
+        return self.exact_hits + self.similar_hits
+
+
+class ResponseCache:
+    """
+    SQLite cache of replies keyed on the normalized message and a hash of everything
+    else that shapes the reply (model, prompt, character sheets). With a `threshold`,
+    messages whose MinHash similarity to a cached one reaches it also count as hits.
+    Entries expire after `ttl` seconds and the least recently used go past `max_entries`.
+    """
+
+    def __init__(self, path: str = 'response_cache.sqlite3', max_entries: int = 2000,
+                 ttl: float = 30 * 24 * 3600, threshold: Optional[float] = 0.8):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                context TEXT NOT NULL,
+                message TEXT NOT NULL,
+                signature BLOB NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used);
+            CREATE TABLE IF NOT EXISTS bands (
+                band TEXT NOT NULL,
+                key TEXT NOT NULL REFERENCES responses (key) ON DELETE CASCADE
+            );
+            CREATE INDEX IF NOT EXISTS bands_band ON bands (band);
+            CREATE INDEX IF NOT EXISTS bands_key ON bands (key);
+        """)
+        self._db.execute("PRAGMA foreign_keys = ON")
+
+    @staticmethod
+    def context_hash(*parts: str) -> str:
+        return hashlib.sha256('\0'.join(parts).encode()).hexdigest()[:16]
+
+    @staticmethod
+    def _key(message: str, context: str) -> str:
+        return hashlib.sha256(f'{context}\0{message}'.encode()).hexdigest()
+
+    def _expire(self, now: float):
+        cursor = self._db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        self.stats.evicted += cursor.rowcount
+
+    def get(self, message: str, context: str) -> Optional[Tuple[str, str]]:
+        """(response, 'exact' or 'similar') for a cached reply, or None."""
+        normalized = normalize(message)
+        now = time.time()
+        with self._lock, self._db:
+            self._expire(now)
+            key = self._key(normalized, context)
+            row = self._db.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            kind = 'exact'
+
+            if row is None and self.threshold:
+                row, key = self._find_similar(normalized, context)
+                kind = 'similar'
+
+            if row is None:
+                self.stats.misses += 1
+                return None
+            self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+
+        if kind == 'exact':
+            self.stats.exact_hits += 1
+        else:
+            self.stats.similar_hits += 1
+        return row[0], kind
+
+    def _find_similar(self, normalized: str, context: str):
+        signature = minhash(normalized)
+        bands = _band_keys(signature)
+        candidates = self._db.execute(
+            f"SELECT DISTINCT r.key, r.signature, r.response FROM bands b JOIN responses r ON r.key = b.key "
+            f"WHERE b.band IN ({','.join('?' * len(bands))}) AND r.context = ?",
+            (*bands, context),
+        ).fetchall()
+
+        best, best_score = (None, None), 0.0
+        for key, blob, response in candidates:
+            score = similarity(signature, list(struct.unpack(f'<{NUM_PERM}I', blob)))
+            if score >= self.threshold and score > best_score:
+                best, best_score = ((response,), key), score
+        return best
+
+    def put(self, message: str, context: str, response: str):
+        normalized = normalize(message)
+        key = self._key(normalized, context)
+        signature = minhash(normalized)
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, context, normalized, struct.pack(f'<{NUM_PERM}I', *signature), response, now, now),
+            )
+            self._db.execute("DELETE FROM bands WHERE key = ?", (key,))
+            self._db.executemany("INSERT INTO bands VALUES (?, ?)", [(band, key) for band in _band_keys(signature)])
+
+            cursor = self._db.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self.stats.evicted += cursor.rowcount
+
+    def close(self):
+        self._db.close()
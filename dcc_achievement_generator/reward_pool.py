@@ -0,0 +1,219 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from models import BoxModel
+from usage import _aggregate_usage, _calculate_cost_usd
+
+TIERS = ('bronze', 'silver', 'gold', 'platinum', 'legendary')
+# "gold", "a gold box", "legendary reward", "instant silver loot box", ...
+TIER_REQUEST = re.compile(
+    r"^\s*(?:instant\s+)?(?:an?\s+)?(" + '|'.join(TIERS) + r")(?:\s+(?:loot\s+)?(?:box|reward))?\s*[.!]?\s*$",
+    re.IGNORECASE,
+)
+
+
+def match_tier(message: str) -> Optional[str]:
+    """The tier asked for if the message is just a request for a reward box of that tier."""
+    match = TIER_REQUEST.match(message)
+    return match.group(1).lower() if match else None
+
+
+@dataclass
+class PoolStats:
+    hits: int = 0
+    misses: int = 0
+    generated: int = 0
+    evicted: int = 0
+    spent: float = 0.0  # USD spent generating rewards this session
+    hit_latency: List[float] = field(default_factory=list)       # seconds to hand out a pooled reward
+    miss_latency: List[float] = field(default_factory=list)      # seconds to generate one on demand
+    generate_latency: List[float] = field(default_factory=list)  # seconds per generation call
+
+    @property
+    def hit_rate(self) -> float:
+        requests = self.hits + self.misses
+        return self.hits / requests if requests else 0.0
+
+
+class RewardPool:
+    """
+    Keeps `per_tier` pre-generated BoxModel rewards ready for each tier so they can be
+    handed out without waiting on the model. Refills run in the background between
+    turns, stop once `spend_cap` USD has been spent, and the pool is saved to `path`
+    so leftovers carry over to the next session. Entries older than `ttl` are dropped.
+    With a ModelRouter, each tier is generated on that tier's route.
+    """
+
+    def __init__(self, client, model: str, prompt: str = '', path: str = 'reward_pool.json',
+                 per_tier: int = 2, ttl: float = 7 * 24 * 3600, spend_cap: float = 0.05,
+                 concurrency: int = 4, reasoning: Optional[dict] = None,
+                 prompt_cache_key: Optional[str] = None, metrics=None, router=None):
+        self._ai = client
+        self.model = model
+        self.prompt = prompt
+        self.path = path
+        self.per_tier = per_tier
+        self.ttl = ttl
+        self.spend_cap = spend_cap
+        self.concurrency = max(1, concurrency)
+        self.reasoning = reasoning or {'effort': 'low'}
+        self.prompt_cache_key = prompt_cache_key
+        self.metrics = metrics
+        self.router = router
+        self.stats = PoolStats()
+        self._entries: Dict[str, List[dict]] = {tier: [] for tier in TIERS}
+        self._refill_task: Optional[asyncio.Task] = None
+        self._in_flight = 0
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable reward pool {self.path}: {e}")
+            return
+        for tier in TIERS:
+            self._entries[tier] = saved.get(tier, [])
+        self._evict_stale()
+
+    def save(self):
+        with open(self.path, 'w') as f:
+            json.dump(self._entries, f, indent=2)
+
+    def _evict_stale(self):
+        cutoff = time.time() - self.ttl
+        for tier, entries in self._entries.items():
+            fresh = [e for e in entries if e['created_at'] >= cutoff]
+            self.stats.evicted += len(entries) - len(fresh)
+            self._entries[tier] = fresh
+
+    def size(self, tier: Optional[str] = None) -> int:
+        if tier:
+            return len(self._entries[tier])
+        return sum(len(entries) for entries in self._entries.values())
+
+    @property
+    def over_budget(self) -> bool:
+        # Count generations still running at the average cost so far
+        average = self.stats.spent / self.stats.generated if self.stats.generated else 0.0
+        return self.stats.spent + self._in_flight * average >= self.spend_cap
+
+    async def _generate(self, tier: str) -> Optional[BoxModel]:
+        """Ask the model for one reward box of `tier`, recording its cost and latency. None if it refused."""
+        input = []
+        if self.prompt:
+            input.append({'role': 'system', 'content': self.prompt})
+        input.append({'role': 'user', 'content': f"Generate a {tier} tier reward box. Only the box, no achievement."})
+
+        start = time.perf_counter()
+        if self.router:
+            response, route = await self.router.parse(
+                self._ai, self.router.for_tier(tier),
+                input=input,
+                prompt_cache_key=self.prompt_cache_key,
+                text_format=BoxModel,
+            )
+            model, label = route.model, route.label('pool')
+        else:
+            response = await self._ai.responses.parse(
+                input=input,
+                model=self.model,
+                reasoning=self.reasoning,
+                prompt_cache_key=self.prompt_cache_key,
+                text_format=BoxModel,
+            )
+            model, label = self.model, 'pool'
+        latency = time.perf_counter() - start
+        self.stats.generate_latency.append(latency)
+        if self.metrics:
+            self.metrics.record(model, response.usage, latency, route=label)
+        self.stats.spent += _calculate_cost_usd(model, _aggregate_usage([response.usage]))
+        self.stats.generated += 1
+
+        box = response.output_parsed
+        if box is None:
+            logging.warning(f"The model returned no {tier} reward box: {response.output_text!r}")
+            return None
+        box.tier = tier
+        return box
+
+    async def fill(self):
+        """Top every tier up to per_tier, a few generations at a time, within the spend cap."""
+        self._evict_stale()
+        wanted = [tier for tier in TIERS for _ in range(self.per_tier - self.size(tier))]
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def fill_one(tier):
+            async with semaphore:
+                if self.over_budget:
+                    return
+                self._in_flight += 1
+                try:
+                    box = await self._generate(tier)
+                except Exception as e:
+                    logging.warning(f"Reward pool generation failed for {tier}: {e}")
+                    return
+                finally:
+                    self._in_flight -= 1
+                if box is None:
+                    return
+                self._entries[tier].append({'created_at': time.time(), 'box': box.model_dump()})
+
+        await asyncio.gather(*(fill_one(tier) for tier in wanted))
+        if wanted:
+            self.save()
+        if self.over_budget:
+            logging.info(f"Reward pool spend cap of ${self.spend_cap:.4f} reached")
+
+    def schedule_refill(self):
+        """Start a background fill on the running event loop unless one is already running."""
+        if self.over_budget or (self._refill_task and not self._refill_task.done()):
+            return
+        if all(self.size(tier) >= self.per_tier for tier in TIERS):
+            return
+        self._refill_task = asyncio.get_running_loop().create_task(self.fill())
+
+    async def get(self, tier: str) -> Optional[BoxModel]:
+        """
+        A reward box of `tier`: from the pool when one is ready, otherwise generated now.
+        None if the model refused to generate one.
+        """
+        start = time.perf_counter()
+        self._evict_stale()
+        if self._entries[tier]:
+            entry = self._entries[tier].pop(0)
+            self.stats.hits += 1
+            box = BoxModel.model_validate(entry['box'])
+            self.save()
+            self.stats.hit_latency.append(time.perf_counter() - start)
+        else:
+            self.stats.misses += 1
+            box = await self._generate(tier)
+            self.stats.miss_latency.append(time.perf_counter() - start)
+        self.schedule_refill()
+        return box
+
+    def report(self) -> str:
+        s = self.stats
+        lines = [
+            f"Reward pool: {s.hits} hits, {s.misses} misses ({s.hit_rate:.0%} hit rate), "
+            f"{self.size()} ready",
+            f"Generated {s.generated} rewards for ${s.spent:.6f} (cap ${self.spend_cap:.4f}), "
+            f"evicted {s.evicted} stale",
+        ]
+        if s.hit_latency:
+            lines.append(f"Avg latency from the pool: {sum(s.hit_latency) / len(s.hit_latency) * 1000:.1f}ms")
+        if s.miss_latency:
+            lines.append(f"Avg latency on a miss: {sum(s.miss_latency) / len(s.miss_latency):.2f}s")
+        if s.generate_latency:
+            lines.append(f"Avg generation latency: {sum(s.generate_latency) / len(s.generate_latency):.2f}s")
+        return '\n'.join(lines)
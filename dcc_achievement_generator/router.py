@@ -0,0 +1,226 @@
+import asyncio
+import contextlib
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import openai
+
+from reward_pool import TIERS, match_tier
+from usage import PRICING, _calculate_cost_usd
+
+# Model and reasoning effort per expected reward tier: small models for everyday
+# achievements, bigger ones where a memorable legendary box is worth the wait
+TIER_ROUTES = {
+    'bronze': ('gpt-5-nano', 'minimal'),
+    'silver': ('gpt-5-nano', 'low'),
+    'gold': ('gpt-5-mini', 'low'),
+    'platinum': ('gpt-5-mini', 'medium'),
+    'legendary': ('gpt-5', 'medium'),
+}
+# Tried in order of estimated cost when a route's model times out or is rate limited
+FALLBACK_MODELS = ('gpt-5-mini', 'gpt-5-nano', 'gpt-4.1-nano')
+FALLBACK_ERRORS = (openai.RateLimitError, openai.APITimeoutError, asyncio.TimeoutError)
+
+# Rough reasoning tokens per output token at each effort, for cost estimates
+REASONING_FACTOR = {'minimal': 0.0, 'low': 1.0, 'medium': 2.0, 'high': 4.0}
+# Typical tokens of one achievement call (system prompt, history, reply)
+EXPECTED_INPUT = 1500
+EXPECTED_OUTPUT = 300
+
+# A reward tier asked for inside a longer event: "... earns a gold box", "legendary reward for ..."
+# A bare tier word ("found a silver key") doesn't count
+_TIER_REQUEST_IN_EVENT = re.compile(
+    r"\b(" + '|'.join(TIERS) + r")\s+(?:tier|(?:loot\s+)?box|reward)\b", re.IGNORECASE)
+
+
+def is_reasoning_model(model: str) -> bool:
+    return model.startswith(('gpt-5', 'o1', 'o3', 'o4')) and not model.endswith('-chat-latest')
+
+
+def estimate_cost(model: str, effort: Optional[str], input_tokens: int = EXPECTED_INPUT,
+                  output_tokens: int = EXPECTED_OUTPUT) -> Optional[float]:
+    """Estimated USD for one call, counting reasoning tokens as output. None for unpriced models."""
+    if model not in PRICING:
+        return None
+    if is_reasoning_model(model):
+        output_tokens += int(output_tokens * REASONING_FACTOR.get(effort or 'medium', 2.0))
+    return _calculate_cost_usd(model, {'input': input_tokens, 'cached': 0, 'output': output_tokens})
+
+
+def _item_type(item) -> Optional[str]:
+    return item.get('type') if isinstance(item, dict) else getattr(item, 'type', None)
+
+
+def _input_for(attempt: 'Route', kwargs: dict) -> dict:
+    """The request arguments for an attempt. Models that don't reason reject earlier turns' reasoning items."""
+    if is_reasoning_model(attempt.model) or 'input' not in kwargs:
+        return kwargs
+    return {**kwargs, 'input': [item for item in kwargs['input'] if _item_type(item) != 'reasoning']}
+
+
+async def _before(awaitable, deadline: Optional[float]):
+    """Await with a timeout at the event loop time `deadline`, or without one if it's None."""
+    if deadline is None:
+        return await awaitable
+    return await asyncio.wait_for(awaitable, max(0.0, deadline - asyncio.get_running_loop().time()))
+
+
+@dataclass(frozen=True)
+class Route:
+    name: str  # 'default' or the expected tier
+    model: str
+    effort: Optional[str] = None
+
+    @property
+    def reasoning(self) -> Optional[dict]:
+        return {'effort': self.effort} if self.effort and is_reasoning_model(self.model) else None
+
+    def request(self) -> dict:
+        """The model and reasoning arguments for responses.parse/stream."""
+        kwargs = {'model': self.model}
+        if self.reasoning:
+            kwargs['reasoning'] = self.reasoning
+        return kwargs
+
+    def label(self, kind: str) -> str:
+        """Metrics route name, e.g. 'chat' or 'chat:gold'."""
+        return kind if self.name == 'default' else f"{kind}:{self.name}"
+
+
+@dataclass
+class RouterStats:
+    calls: Dict[str, int] = field(default_factory=dict)
+    fallbacks: Dict[str, int] = field(default_factory=dict)  # per route, calls answered by a fallback model
+    failures: Dict[str, int] = field(default_factory=dict)   # per model, timeouts and rate limits
+
+
+class ModelRouter:
+    """
+    Picks the model and reasoning effort for each call from the reward tier it's expected
+    to produce, and retries on cheaper or faster models when one times out or is rate
+    limited. With no tier routes and no fallbacks every call goes to `model`, unchanged.
+    """
+
+    def __init__(self, model: str, effort: str = 'low', tier_routes: Optional[Dict[str, Tuple[str, str]]] = None,
+                 fallbacks: Tuple[str, ...] = (), timeout: Optional[float] = None):
+        self.default = Route('default', model, effort)
+        self.tier_routes = {tier: Route(tier, m, e) for tier, (m, e) in (tier_routes or {}).items()}
+        self.fallbacks = fallbacks
+        self.timeout = timeout
+        self.stats = RouterStats()
+
+    @classmethod
+    def by_tier(cls, model: str, effort: str = 'low', timeout: Optional[float] = 30.0) -> 'ModelRouter':
+        """The standard tier routes and fallbacks, with `model` for events that don't name a tier."""
+        return cls(model, effort, TIER_ROUTES, FALLBACK_MODELS, timeout)
+
+    def for_tier(self, tier: Optional[str]) -> Route:
+        return self.tier_routes.get(tier, self.default)
+
+    def route(self, message: str) -> Route:
+        """The route for an event, from the reward tier it explicitly asks for, if any."""
+        tier = match_tier(message)
+        if tier is None:
+            match = _TIER_REQUEST_IN_EVENT.search(message)
+            tier = match.group(1).lower() if match else None
+        return self.for_tier(tier)
+
+    def attempts(self, route: Route) -> List[Route]:
+        """The route followed by its fallbacks: cheaper models, or non-reasoning ones that answer faster."""
+        cost = estimate_cost(route.model, route.effort)
+        candidates = []
+        for model in self.fallbacks:
+            if model == route.model:
+                continue
+            effort = 'minimal' if is_reasoning_model(model) else None
+            estimate = estimate_cost(model, effort)
+            if cost is None or (estimate is not None and estimate < cost) or not is_reasoning_model(model):
+                candidates.append((estimate or 0.0, Route(route.name, model, effort)))
+        # Closest in cost first, so quality drops as little as it has to
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        return [route] + [candidate for _, candidate in candidates]
+
+    def _client_for(self, client, last: bool):
+        # Earlier attempts fail over at once instead of sitting through the client's own retries
+        if last or not hasattr(client, 'with_options'):
+            return client
+        return client.with_options(max_retries=0)
+
+    def _failed(self, route: Route, attempt: Route, error: Exception):
+        self.stats.failures[attempt.model] = self.stats.failures.get(attempt.model, 0) + 1
+        logging.warning(f"{attempt.model} failed for route {route.name} ({type(error).__name__}), falling back")
+
+    def _answered(self, route: Route, attempt: Route):
+        self.stats.calls[route.name] = self.stats.calls.get(route.name, 0) + 1
+        if attempt != route:
+            self.stats.fallbacks[route.name] = self.stats.fallbacks.get(route.name, 0) + 1
+
+    async def parse(self, client, route: Route, **kwargs):
+        """client.responses.parse on the route, falling back on timeouts and rate limits. Returns (response, route used)."""
+        attempts = self.attempts(route)
+        for i, attempt in enumerate(attempts):
+            last = i == len(attempts) - 1
+            try:
+                response = await asyncio.wait_for(
+                    self._client_for(client, last).responses.parse(**attempt.request(), **_input_for(attempt, kwargs)),
+                    None if last else self.timeout,
+                )
+            except FALLBACK_ERRORS as e:
+                if last:
+                    raise
+                self._failed(route, attempt, e)
+                continue
+            self._answered(route, attempt)
+            return response, attempt
+
+    async def stream(self, client, route: Route, **kwargs) -> AsyncIterator[Tuple[Route, str, object]]:
+        """
+        client.responses.stream on the route, yielding (route used, text delta, None) per delta and
+        then (route used, '', final response). Falls back only until the first delta arrives, and
+        `timeout` bounds the whole wait for it, however many other events come first.
+        """
+        loop = asyncio.get_running_loop()
+        attempts = self.attempts(route)
+        for i, attempt in enumerate(attempts):
+            last = i == len(attempts) - 1
+            started = False
+            # Only the wait for the first token is bounded; after that the reply is committed
+            deadline = None if last or self.timeout is None else loop.time() + self.timeout
+            try:
+                async with contextlib.AsyncExitStack() as stack:
+                    manager = self._client_for(client, last).responses.stream(**attempt.request(), **_input_for(attempt, kwargs))
+                    stream = await _before(stack.enter_async_context(manager), deadline)
+                    events = stream.__aiter__()
+                    while True:
+                        try:
+                            event = await _before(events.__anext__(), deadline)
+                        except StopAsyncIteration:
+                            break
+                        if event.type != 'response.output_text.delta':
+                            continue
+                        started, deadline = True, None
+                        yield attempt, event.delta, None
+                    response = await stream.get_final_response()
+            except FALLBACK_ERRORS as e:
+                if started or last:
+                    raise
+                self._failed(route, attempt, e)
+                continue
+            self._answered(route, attempt)
+            yield attempt, '', response
+            return
+
+    def report(self) -> str:
+        s = self.stats
+        lines = ['Model routes:']
+        for route in [self.default, *self.tier_routes.values()]:
+            calls = s.calls.get(route.name, 0)
+            if not calls:
+                continue
+            lines.append(f"  {route.name}: {route.model} ({route.effort or 'no'} reasoning), {calls} calls, "
+                         f"{s.fallbacks.get(route.name, 0)} answered by a fallback")
+        if s.failures:
+            lines.append('  Timeouts and rate limits: ' + ', '.join(f"{m} {n}" for m, n in s.failures.items()))
+        return '\n'.join(lines)
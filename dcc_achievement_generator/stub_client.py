@@ -0,0 +1,199 @@
+"""
+Offline stand-in for AsyncOpenAI. responses.parse and responses.stream return synthetic
+AchievementModel / BoxModel results after a simulated delay, with usage numbers shaped
+like the real API's (including prompt caching), so throughput and reporting can be
+exercised without an API key or spend. Per-model latencies and rate limit rates make
+model routing and fallbacks testable too.
+"""
+
+import asyncio
+import random
+from types import SimpleNamespace
+from typing import Dict, Optional
+
+import httpx
+import openai
+
+from history import CHARS_PER_TOKEN
+from models import AchievementModel, BoxModel, RewardModel
+from reward_pool import TIERS
+from router import is_reasoning_model
+
+# The API only caches prompts of at least this many tokens, in 128-token steps
+CACHE_MIN_TOKENS = 1024
+CACHE_STEP = 128
+# Higher reasoning effort takes longer and emits reasoning tokens, per output token
+EFFORT_SCALE = {None: 0.5, 'minimal': 0.5, 'low': 1.0, 'medium': 2.0, 'high': 4.0}
+
+
+def _content(item) -> str:
+    if isinstance(item, dict):
+        return str(item.get('content', ''))
+    return str(getattr(item, 'content', ''))
+
+
+def _sample_box(tier: str) -> BoxModel:
+    return BoxModel(
+        tier=tier,
+        box_name=f"{tier.title()} Stub Box",
+        box_contents=[RewardModel(name="Stub trinket", description="Suspiciously generic.",
+                                  benefits="+1 to nothing in particular")],
+    )
+
+
+def sample_output(text_format, event: str):
+    """A valid instance of `text_format` that mentions the event."""
+    tier = next((t for t in TIERS if t in event.lower()), TIERS[0])
+    if text_format is BoxModel:
+        return _sample_box(tier)
+    return AchievementModel(
+        achievement_title=f"Stub: {event[:40]}",
+        achievement_desc=f"You did it: {event}",
+        reward=_sample_box(tier),
+    )
+
+
+class _Stream:
+    def __init__(self, responses, kwargs):
+        self._responses = responses
+        self._kwargs = kwargs
+        self._final = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    async def __aiter__(self):
+        responses = self._responses
+        async with responses._track(self._kwargs):
+            delay = responses._delay(self._kwargs)
+            # Spend part of the delay before the first token, like reasoning and queueing
+            await asyncio.sleep(delay * responses.ttft_share)
+            self._final = responses._response(**self._kwargs)
+            text = self._final.output_text
+            chunks = [text[i:i + responses.chunk_chars] for i in range(0, len(text), responses.chunk_chars)]
+            for chunk in chunks:
+                await asyncio.sleep(delay * (1 - responses.ttft_share) / len(chunks))
+                yield SimpleNamespace(type='response.output_text.delta', delta=chunk)
+
+    async def get_final_response(self):
+        if self._final is None:
+            async for _ in self:
+                pass
+        return self._final
+
+
+class StubResponses:
+    def __init__(self, latency: float = 0.5, jitter: float = 0.1, ttft_share: float = 0.3,
+                 chunk_chars: int = 16, seed: Optional[int] = None,
+                 model_latency: Optional[Dict[str, float]] = None, rate_limits: Optional[Dict[str, float]] = None):
+        self.latency = latency
+        self.model_latency = model_latency or {}  # base latency per model, instead of `latency`
+        self.rate_limits = rate_limits or {}  # share of calls per model that fail with a 429
+        self.jitter = jitter
+        self.ttft_share = ttft_share
+        self.chunk_chars = chunk_chars
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls_by_model: Dict[str, int] = {}
+        self._random = random.Random(seed)
+        self._cached_prefixes = set()
+
+    @staticmethod
+    def _effort(kwargs) -> Optional[str]:
+        return (kwargs.get('reasoning') or {}).get('effort')
+
+    def _delay(self, kwargs) -> float:
+        latency = self.model_latency.get(kwargs.get('model'), self.latency) * EFFORT_SCALE[self._effort(kwargs)]
+        return max(0.0, latency + self._random.uniform(-self.jitter, self.jitter))
+
+    def _rate_limit(self, model: str):
+        if self._random.random() < self.rate_limits.get(model, 0.0):
+            request = httpx.Request('POST', 'https://stub.invalid/v1/responses')
+            raise openai.RateLimitError(f"Stub rate limit for {model}",
+                                        response=httpx.Response(429, request=request), body=None)
+
+    @staticmethod
+    def _check_input(kwargs):
+        # Like the API, refuse reasoning items from earlier turns on a model that doesn't reason
+        model = kwargs.get('model')
+        if not is_reasoning_model(model) and any(
+                isinstance(item, dict) and item.get('type') == 'reasoning' for item in kwargs.get('input', [])):
+            request = httpx.Request('POST', 'https://stub.invalid/v1/responses')
+            raise openai.BadRequestError(f"Reasoning input items are not supported with {model}",
+                                         response=httpx.Response(400, request=request), body=None)
+
+    def _track(self, kwargs):
+        responses = self
+
+        class Tracker:
+            async def __aenter__(self):
+                model = kwargs.get('model')
+                responses.calls_by_model[model] = responses.calls_by_model.get(model, 0) + 1
+                responses._check_input(kwargs)
+                responses._rate_limit(model)
+                responses.calls += 1
+                responses.in_flight += 1
+                responses.max_in_flight = max(responses.max_in_flight, responses.in_flight)
+
+            async def __aexit__(self, exc_type, exc_val, exc_tb):
+                responses.in_flight -= 1
+
+        return Tracker()
+
+    def _usage(self, input, prompt_cache_key, output_text: str, effort: Optional[str] = None):
+        prefix = ''.join(_content(item) for item in input if isinstance(item, dict) and item.get('role') == 'system')
+        prefix_tokens = len(prefix) // CHARS_PER_TOKEN
+        input_tokens = sum(len(_content(item)) for item in input) // CHARS_PER_TOKEN + 1
+
+        cached = 0
+        key = (prompt_cache_key, prefix)
+        if prefix_tokens >= CACHE_MIN_TOKENS:
+            if key in self._cached_prefixes:
+                cached = prefix_tokens // CACHE_STEP * CACHE_STEP
+            self._cached_prefixes.add(key)
+
+        text_tokens = len(output_text) // CHARS_PER_TOKEN + 1
+        reasoning_tokens = int(text_tokens * EFFORT_SCALE[effort]) if effort and effort != 'minimal' else 0
+        return SimpleNamespace(
+            input_tokens=input_tokens,
+            output_tokens=text_tokens + reasoning_tokens,
+            input_tokens_details=SimpleNamespace(cached_tokens=cached),
+            output_tokens_details=SimpleNamespace(reasoning_tokens=reasoning_tokens),
+        )
+
+    def _response(self, input, model, text_format=AchievementModel, prompt_cache_key=None, reasoning=None,
+                  **kwargs):
+        event = next((_content(item) for item in reversed(input)
+                      if isinstance(item, dict) and item.get('role') == 'user'), '')
+        parsed = sample_output(text_format, event)
+        text = parsed.model_dump_json()
+        output = [{'role': 'assistant', 'content': text}]
+        if is_reasoning_model(model):
+            # Reasoning models put a reasoning item before the message, which the history keeps
+            output.insert(0, {'type': 'reasoning', 'id': f'rs_stub_{self.calls}', 'summary': []})
+        return SimpleNamespace(
+            model=model,
+            output_parsed=parsed,
+            output_text=text,
+            output=output,
+            usage=self._usage(input, prompt_cache_key, text, (reasoning or {}).get('effort')),
+        )
+
+    async def parse(self, **kwargs):
+        async with self._track(kwargs):
+            await asyncio.sleep(self._delay(kwargs))
+            return self._response(**kwargs)
+
+    def stream(self, **kwargs):
+        return _Stream(self, kwargs)
+
+
+class StubAsyncOpenAI:
+    """Drop-in for AsyncOpenAI() where only client.responses is used."""
+
+    def __init__(self, **kwargs):
+        self.responses = StubResponses(**kwargs)
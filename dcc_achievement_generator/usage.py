@@ -21,7 +21,8 @@ def _calculate_cost_usd(model, usage) -> float:
     rates = PRICING.get(model)
     if not rates:
         return 0.0
-    input_cost = usage['input'] * rates['input']
+    # input_tokens includes the cached ones, which are billed at the cached rate instead
+    input_cost = (usage['input'] - usage['cached']) * rates['input']
     cached_cost = usage['cached'] * rates.get('cached', rates['input'])
     output_cost = usage['output'] * rates['output']
     # Prices are per 1M tokens.
@@ -38,32 +39,77 @@ def _aggregate_usage(usages):
     return total
 
 
-def print_usage(model, usage, file=sys.stderr):
-    print(' Usage '.center(30, '-'), file=file)
-    print('Model:', model, file=file)
+def _as_metrics(model, usage):
+    # Imported here because metrics imports this module for pricing
+    from metrics import Metrics
 
+    if isinstance(usage, Metrics):
+        return usage
     if not isinstance(usage, list):
         usage = [usage]
-    total = _aggregate_usage(usage)
+    return Metrics.from_usages(model, usage)
+
+
+def _cache_hits_line(cache_stats) -> str:
+    return (f"{cache_stats.exact_hits} exact + {cache_stats.similar_hits} similar hits, "
+            f"{cache_stats.misses} misses (not counted in the token totals)")
+
 
-    for key, value in total.items():
+def _quantiles(window) -> str:
+    return f"p50 {window.quantile(0.5):.2f}s, p95 {window.quantile(0.95):.2f}s"
+
+
+def _route_lines(metrics) -> list:
+    """Calls, mean latency and cost per route, when calls went to more than one."""
+    if len(metrics.routes) < 2:
+        return []
+    return [
+        f"{route}: {totals['calls']} calls, {totals['latency'] / totals['calls']:.2f}s avg, ${totals['cost']:.6f}"
+        for route, totals in sorted(metrics.routes.items())
+    ]
+
+
+def print_usage(model, usage, file=sys.stderr, cache_stats=None):
+    """Print totals for a Metrics or a list of response.usage objects."""
+    metrics = _as_metrics(model, usage)
+    print(' Usage '.center(30, '-'), file=file)
+    print('Model:', model, file=file)
+
+    for key, value in metrics.totals.items():
         print(f'{key.title()} (tokens):', value, file=file)
 
-    cost = _calculate_cost_usd(model, total)
-    if cost is not None:
-        print(f'Total cost (USD): ${cost:.6f}', file=file)
+    if model in PRICING:
+        print(f'Total cost (USD): ${metrics.cost:.6f}', file=file)
     else:
         print('Total cost: n/a (pricing unavailable for model)', file=file)
 
+    print(f'Prompt cache hit ratio: {metrics.cache_hit_ratio:.0%} (saved ${metrics.cache_saved_usd:.6f})', file=file)
 
-def format_usage_markdown(model, usage) -> str:
-    if not isinstance(usage, list):
-        usage = [usage]
-    total_usage = _aggregate_usage(usage)
-    cost = _calculate_cost_usd(model, total_usage)
+    if metrics.latency.total:
+        print(f'Latency: {_quantiles(metrics.latency)} over the last {len(metrics.latency)} calls', file=file)
+    if len(metrics.ttft):
+        print(f'Time to first token: {_quantiles(metrics.ttft)}', file=file)
+    if metrics.tokens_per_second:
+        print(f'Throughput: {metrics.tokens_per_second:.0f} output tokens/s, '
+              f'${metrics.cost_per_hour:.4f}/hour', file=file)
+
+    for line in _route_lines(metrics):
+        print('Route', line, file=file)
+
+    if cache_stats:
+        print('Response cache:', _cache_hits_line(cache_stats), file=file)
+
+    if metrics.history_saved:
+        print(f'History compaction saved ~{metrics.history_saved} input tokens '
+              f'(${metrics.history_saved_usd:.6f})', file=file)
+
+
+def format_usage_markdown(model, usage, cache_stats=None) -> str:
+    """Markdown usage summary for a Metrics or a list of response.usage objects."""
+    metrics = _as_metrics(model, usage)
     token_table = '\n'.join(
         f"| {key.title()} | {value} |"
-        for key, value in total_usage.items()
+        for key, value in metrics.totals.items()
     )
 
     out = (
@@ -72,7 +118,28 @@ def format_usage_markdown(model, usage) -> str:
         "|    | Tokens |\n"
         "|----|--------|\n"
         + token_table +
-        f"\n\n**Total cost**: ${cost:.6f}\n"
+        f"\n\n**Total cost**: ${metrics.cost:.6f}\n"
     )
-    print(out)
+    if metrics.totals['input']:
+        out += (f"\n**Prompt cache**: {metrics.cache_hit_ratio:.0%} of input tokens cached, "
+                f"saved ${metrics.cache_saved_usd:.6f}\n")
+    if metrics.last and metrics.latency.total:
+        out += f"\n**Latency**: {metrics.last.latency:.2f}s last call ({_quantiles(metrics.latency)})\n"
+    if len(metrics.ttft):
+        out += f"\n**Time to first token**: {_quantiles(metrics.ttft)}\n"
+    if metrics.tokens_per_second:
+        out += (f"\n**Throughput**: {metrics.tokens_per_second:.0f} output tokens/s, "
+                f"${metrics.cost_per_hour:.4f}/hour\n")
+    routes = _route_lines(metrics)
+    if routes:
+        out += "\n**Routes**:\n" + ''.join(f"- {line}\n" for line in routes)
+    if cache_stats:
+        out += f"\n**Response cache**: {_cache_hits_line(cache_stats)}\n"
+    if metrics.history_saved:
+        # Only chat turns carry history savings, so there is one once anything was saved
+        last_turn = metrics.last_chat
+        out += (
+            f"\n**History compaction**: ~{last_turn.history_saved} input tokens saved last turn, "
+            f"~{metrics.history_saved} in total (${metrics.history_saved_usd:.6f})\n"
+        )
     return out